@@ -3,6 +3,8 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from pathlib import Path
+import hashlib
+import json
 import sys
 
 # Add project root so we can import local modules when running via `streamlit run app.py`
@@ -10,7 +12,52 @@ project_root = Path(__file__).parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
-from src.predict import predict_mental_health
+from src.predict import (
+    enable_hot_reload,
+    find_habit_changes,
+    get_model_version,
+    get_what_if_curves,
+    predict_mental_health,
+)
+
+# Results shared across sessions (identical inputs on the same model version)
+RESULT_CACHE_ENTRIES = 2048
+
+
+@st.cache_resource(show_spinner="Loading model...")
+def load_model():
+    """
+    Load and warm the model once per server process, shared by every session,
+    and pick up retrained models without restarting the app.
+    """
+    enable_hot_reload()
+    get_model_version().warm()
+
+
+def cache_key(user_features):
+    """Hashable input vector (plus the serving model version) for the shared caches."""
+    return tuple(sorted((name, float(value)) for name, value in user_features.items())), get_model_version().version
+
+
+@st.cache_data(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def cached_prediction(key):
+    return predict_mental_health(dict(key[0]))
+
+
+@st.cache_data(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def cached_what_if_curves(key):
+    return get_what_if_curves(dict(key[0]))
+
+
+@st.cache_data(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def cached_habit_changes(key, top_k):
+    return find_habit_changes(dict(key[0]), top_k=top_k)
+
+
+def result_hash(result):
+    """Stable digest of a prediction result, the key of the cached figures below."""
+    return hashlib.sha256(json.dumps(result, sort_keys=True, default=str).encode()).hexdigest()
+
 
 # -----------------------------------------------------------------------------
 # Page configuration + global styles
@@ -22,6 +69,14 @@ st.set_page_config(
     initial_sidebar_state="collapsed",
 )
 
+# After set_page_config: its spinner is the first element the page draws.
+# A failed load is not cached, so every rerun retries it; meanwhile the survey
+# still renders and predictions report the error.
+try:
+    load_model()
+except Exception as exc:
+    st.error(f"The model could not be loaded: {exc}. Run `python -m src.train` and reload the page.")
+
 st.markdown(
     """
     <style>
@@ -1118,7 +1173,7 @@ def run_prediction():
 
     try:
         loading_placeholder.markdown(loader_html, unsafe_allow_html=True)
-        result = predict_mental_health(user_features)
+        result = cached_prediction(cache_key(user_features))
         st.session_state.prediction_result = result
         st.session_state.last_error = None
     except Exception as exc:
@@ -1299,6 +1354,32 @@ def generate_simple_recommendations(contributions):
     return recommendations
 
 
+def counterfactual_recommendations(result):
+    """Recommendations from the counterfactual search: the smallest changes that reach the next tier."""
+    user_features = {c["feature"]: c["value"] for c in result["contributions"]}
+    try:
+        search = cached_habit_changes(cache_key(user_features), top_k=2)
+    except Exception:
+        return []
+
+    recs = []
+    target = search["target_category"]
+    target_label = target if target == "Healthy" else f"{target} Risk"
+    for counterfactual in search["counterfactuals"]:
+        steps = []
+        for change in counterfactual["changes"]:
+            label = FEATURE_LABELS.get(change["feature"], change["feature"]).lower()
+            if change["feature"] == "social_media_platforms_used":
+                steps.append(f"{label} {change['from']:.0f} → {change['to']:.0f}")
+            else:
+                steps.append(f"{label} {change['from']:.1f} → {change['to']:.1f} hrs")
+        recs.append(
+            f"🎯 Smallest step to {target_label}: {' and '.join(steps)} is predicted to lift "
+            f"your score to {counterfactual['predicted_score']:.2f}."
+        )
+    return recs
+
+
 def recommendations_from_contrib(contributions):
     """Generate actionable recommendations based on feature contributions."""
     recs = []
@@ -1382,90 +1463,194 @@ def recommendations_from_contrib(contributions):
     return recs
 
 
-def render_feature_contributions(result):
-    contributions = result["contributions"]
-    contrib_df = pd.DataFrame(contributions)
+# Figures are cached as resources, not data: a hit returns the built Figure
+# itself (no unpickling), so a rerun only pays for st.plotly_chart serializing it.
+# Streamlit converts a figure to a fresh dict before rendering, so sharing is safe.
+@st.cache_resource(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def contribution_figures(key, _result):
+    """
+    Contribution bar and pie charts plus the detailed-breakdown table for the
+    result with result_hash `key`, built once and shared by reruns and sessions.
+    """
+    contrib_df = pd.DataFrame(_result["contributions"])
     contrib_df["feature_display"] = contrib_df["feature"].map(FEATURE_LABELS).fillna(contrib_df["feature"])
 
-    viz_col1, viz_col2 = st.columns(2)
-    
-    with viz_col1:
-        fig_bar = go.Figure()
-        positive = contrib_df[contrib_df["normalized_contribution"] > 0]
-        negative = contrib_df[contrib_df["normalized_contribution"] < 0]
-
-        if not positive.empty:
-            fig_bar.add_trace(
-                go.Bar(
-                    y=positive["feature_display"],
-                    x=positive["normalized_contribution"],
-                    orientation="h",
-                    name="Boosts score",
-                    marker_color="#22d3ee",
-                    text=[f"+{x:.3f}" for x in positive["normalized_contribution"]],
-                    textposition="auto",
-                )
+    fig_bar = go.Figure()
+    positive = contrib_df[contrib_df["normalized_contribution"] > 0]
+    negative = contrib_df[contrib_df["normalized_contribution"] < 0]
+
+    if not positive.empty:
+        fig_bar.add_trace(
+            go.Bar(
+                y=positive["feature_display"],
+                x=positive["normalized_contribution"],
+                orientation="h",
+                name="Boosts score",
+                marker_color="#22d3ee",
+                text=[f"+{x:.3f}" for x in positive["normalized_contribution"]],
+                textposition="auto",
             )
+        )
 
-        if not negative.empty:
-            fig_bar.add_trace(
-                go.Bar(
-                    y=negative["feature_display"],
-                    x=negative["normalized_contribution"],
-                    orientation="h",
-                    name="Pulls score down",
-                    marker_color="#f87171",
-                    text=[f"{x:.3f}" for x in negative["normalized_contribution"]],
-                    textposition="auto",
-                )
+    if not negative.empty:
+        fig_bar.add_trace(
+            go.Bar(
+                y=negative["feature_display"],
+                x=negative["normalized_contribution"],
+                orientation="h",
+                name="Pulls score down",
+                marker_color="#f87171",
+                text=[f"{x:.3f}" for x in negative["normalized_contribution"]],
+                textposition="auto",
             )
-        
-        fig_bar.update_layout(
-            title="Feature contributions to mental health score",
-            xaxis_title="Normalized contribution",
-            yaxis_title="",
-            barmode="relative",
-            showlegend=True,
-            height=420,
-            margin=dict(l=0, r=0, t=70, b=20),
-            plot_bgcolor="rgba(0,0,0,0)",
-            paper_bgcolor="rgba(0,0,0,0)",
-            font=dict(color="#f8fafc"),
-            xaxis=dict(gridcolor="rgba(148,163,184,0.3)"),
-            yaxis=dict(gridcolor="rgba(148,163,184,0.2)"),
         )
+
+    fig_bar.update_layout(
+        title="Feature contributions to mental health score",
+        xaxis_title="Normalized contribution",
+        yaxis_title="",
+        barmode="relative",
+        showlegend=True,
+        height=420,
+        margin=dict(l=0, r=0, t=70, b=20),
+        plot_bgcolor="rgba(0,0,0,0)",
+        paper_bgcolor="rgba(0,0,0,0)",
+        font=dict(color="#f8fafc"),
+        xaxis=dict(gridcolor="rgba(148,163,184,0.3)"),
+        yaxis=dict(gridcolor="rgba(148,163,184,0.2)"),
+    )
+
+    fig_pie = px.pie(
+        contrib_df,
+        values="abs_contribution",
+        names="feature_display",
+        title="Relative feature importance",
+        color_discrete_sequence=["#8b5cf6", "#06b6d4", "#ec4899", "#f97316", "#14b8a6"],
+    )
+    fig_pie.update_traces(
+        textposition="inside",
+        textinfo="percent+label",
+        hovertemplate="<b>%{label}</b><br>Contribution: %{value:.3f}<extra></extra>",
+    )
+    fig_pie.update_layout(
+        height=420,
+        margin=dict(l=0, r=0, t=70, b=20),
+        plot_bgcolor="rgba(0,0,0,0)",
+        paper_bgcolor="rgba(0,0,0,0)",
+        font=dict(color="#f8fafc"),
+    )
+
+    display_df = contrib_df[["feature_display", "value", "normalized_contribution", "direction"]].copy()
+    display_df.columns = ["Feature", "Your value", "Contribution", "Impact"]
+    display_df["Impact"] = display_df["Impact"].str.replace("_", " ").str.title()
+    display_df["Contribution"] = display_df["Contribution"].map(lambda x: f"{x:.4f}")
+    return fig_bar, fig_pie, display_df
+
+
+def render_feature_contributions(result):
+    fig_bar, fig_pie, display_df = contribution_figures(result_hash(result), result)
+
+    viz_col1, viz_col2 = st.columns(2)
+    
+    with viz_col1:
         st.plotly_chart(fig_bar, use_container_width=True)
     
     with viz_col2:
-        fig_pie = px.pie(
-            contrib_df,
-            values="abs_contribution",
-            names="feature_display",
-            title="Relative feature importance",
-            color_discrete_sequence=["#8b5cf6", "#06b6d4", "#ec4899", "#f97316", "#14b8a6"],
-        )
-        fig_pie.update_traces(
-            textposition="inside",
-            textinfo="percent+label",
-            hovertemplate="<b>%{label}</b><br>Contribution: %{value:.3f}<extra></extra>",
-        )
-        fig_pie.update_layout(
-            height=420,
-            margin=dict(l=0, r=0, t=70, b=20),
-            plot_bgcolor="rgba(0,0,0,0)",
-            paper_bgcolor="rgba(0,0,0,0)",
-            font=dict(color="#f8fafc"),
-        )
         st.plotly_chart(fig_pie, use_container_width=True)
     
     st.markdown("#### Detailed breakdown")
-    display_df = contrib_df[["feature_display", "value", "normalized_contribution", "direction"]].copy()
-    display_df.columns = ["Feature", "Your value", "Contribution", "Impact"]
-    display_df["Impact"] = display_df["Impact"].str.replace("_", " ").str.title()
-    display_df["Contribution"] = display_df["Contribution"].map(lambda x: f"{x:.4f}")
     st.dataframe(display_df, use_container_width=True, hide_index=True)
 
 
+@st.cache_resource(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def what_if_figure(key, curves_key, feature, _result, _curves):
+    """
+    What-if chart of `feature` for the result with result_hash `key` and the
+    curves cached under `curves_key` (see contribution_figures).
+    """
+    curve = _curves[feature]
+    label = FEATURE_LABELS.get(feature, feature)
+
+    fig = go.Figure()
+    if "pd" in curve:
+        fig.add_trace(
+            go.Scatter(
+                x=curve["grid"] + curve["grid"][::-1],
+                y=curve["ice_p90"] + curve["ice_p10"][::-1],
+                fill="toself",
+                fillcolor="rgba(148,163,184,0.18)",
+                line=dict(width=0),
+                hoverinfo="skip",
+                name="Typical range (10th–90th pct)",
+            )
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=curve["grid"],
+                y=curve["pd"],
+                mode="lines",
+                line=dict(color="#94a3b8", dash="dash"),
+                name="Average person",
+            )
+        )
+    fig.add_trace(
+        go.Scatter(
+            x=curve["grid"],
+            y=curve["ice"],
+            mode="lines",
+            line=dict(color="#22d3ee", width=3),
+            name="You",
+        )
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=[curve["current_value"]],
+            y=[_result["predicted_score"]],
+            mode="markers",
+            marker=dict(color="#f8fafc", size=11, line=dict(color="#22d3ee", width=2)),
+            name="Your current value",
+        )
+    )
+    fig.update_layout(
+        title=f"Predicted score as {label.lower()} changes",
+        xaxis_title=label,
+        yaxis_title="Predicted mental health score",
+        height=380,
+        margin=dict(l=0, r=0, t=70, b=20),
+        plot_bgcolor="rgba(0,0,0,0)",
+        paper_bgcolor="rgba(0,0,0,0)",
+        font=dict(color="#f8fafc"),
+        xaxis=dict(gridcolor="rgba(148,163,184,0.3)"),
+        yaxis=dict(gridcolor="rgba(148,163,184,0.2)"),
+    )
+    return fig
+
+
+@st.fragment
+def render_what_if_curves(result):
+    """
+    Interactive partial-dependence / ICE chart: how the score moves if one habit
+    changes. A fragment, so picking another habit reruns only this chart.
+    """
+    user_features = {c["feature"]: c["value"] for c in result["contributions"]}
+    curves_key = cache_key(user_features)
+    try:
+        curves = cached_what_if_curves(curves_key)
+    except Exception as exc:
+        st.caption(f"What-if curves unavailable: {exc}")
+        return
+
+    feature = st.radio(
+        "Habit to vary",
+        options=list(curves.keys()),
+        format_func=lambda name: FEATURE_LABELS.get(name, name),
+        horizontal=True,
+        key="what_if_feature",
+    )
+    fig = what_if_figure(result_hash(result), curves_key, feature, result, curves)
+    st.plotly_chart(fig, use_container_width=True)
+
+
 def render_results(result):
     # Anchor to auto-scroll when results appear
     st.markdown('<div id="results-anchor"></div>', unsafe_allow_html=True)
@@ -1502,7 +1687,9 @@ def render_results(result):
         st.markdown(f'<div class="input-grid">{chips}</div>', unsafe_allow_html=True)
         
         # Personalized recommendations - simple format
-        recommendations = generate_simple_recommendations(result["contributions"])
+        recommendations = counterfactual_recommendations(result) + generate_simple_recommendations(
+            result["contributions"]
+        )
         
         if recommendations:
             st.markdown('<div class="personalized-suggestions">', unsafe_allow_html=True)
@@ -1571,6 +1758,27 @@ def render_results(result):
             "Critical": "Your mental well-being requires immediate attention. Your current lifestyle factors are severely affecting your mental health and substantial changes are needed."
         }
         score_description = score_descriptions.get(risk_label, "Monitor your mental well-being score and consider adjustments to your digital habits.")
+
+        # Spread of the forest's trees around this score (forest backend only)
+        confidence_html = ""
+        uncertainty = result.get("uncertainty")
+        if uncertainty:
+            tier_share = uncertainty["tier_probabilities"].get(risk_label, 0.0)
+            borderline = " · borderline" if tier_share < 0.6 else ""
+            confidence_html = (
+                f'<p style="font-size: 0.85rem; opacity: 0.8;">{tier_share:.0%} of the model\'s trees agree on this '
+                f'category{borderline} · likely range {uncertainty["quantiles"]["p05"]:.1f} to '
+                f'{uncertainty["quantiles"]["p95"]:.1f}</p>'
+            )
+
+        # Mood and stress behind the score (multi-output model only)
+        components_html = ""
+        components = result.get("components")
+        if components:
+            components_html = (
+                f'<p style="font-size: 0.85rem; opacity: 0.8;">Predicted mood {components["mood_score"]:.1f} '
+                f'&minus; stress {components["stress_level"]:.1f}</p>'
+            )
         
         bounds_text = (
             f"Critical (&lt; {SCORE_BOUNDARIES['Critical']:.0f}), "
@@ -1586,6 +1794,8 @@ def render_results(result):
                 <p class="eyebrow">Mental Health Score</p>
                 <h1>{result["predicted_score"]:.2f}</h1>
                 <p>{score_description}</p>
+                {confidence_html}
+                {components_html}
                 <div class="score-spectrum">
                     <div class="score-spectrum-label">Score Range</div>
                     <div class="score-spectrum-bar" style="background: {bar_gradient};">
@@ -1610,6 +1820,9 @@ def render_results(result):
     st.markdown("#### Feature contributions & importance")
     render_feature_contributions(result)
 
+    st.markdown("#### What if you changed one habit?")
+    render_what_if_curves(result)
+
     # Smoothly scroll the freshly-added results into view
     st.markdown(
         """
@@ -1633,8 +1846,9 @@ def render_results(result):
 # -----------------------------------------------------------------------------
 # UI flow
 # -----------------------------------------------------------------------------
-clamp_step()
-current_step = st.session_state.survey_step
+# Everything at this level (styles, hero, results) is only emitted on full
+# reruns: after a prediction or a restart. Survey steps and the what-if chart
+# are fragments that rerun on their own (see render_survey).
 compact_mode = st.session_state.prediction_result is None
 
 if compact_mode:
@@ -1722,8 +1936,6 @@ st.markdown(
 )
 
 def render_digital_step():
-    next_clicked = False
-    
     with st.form("step-digital", clear_on_submit=False):
         st.markdown("#### Q1 · Daily digital tempo")
         st.caption("Calibrate how much glow time you average each day.")
@@ -1741,49 +1953,46 @@ def render_digital_step():
             screen_time_kwargs["value"] = float(st.session_state["screen_time_hours"])
         else:
             screen_time_kwargs["value"] = DEFAULT_INPUTS["screen_time_hours"]
-        slider_value = st.slider("Screen time (hours / day)", **screen_time_kwargs)
+        st.slider("Screen time (hours / day)", **screen_time_kwargs)
         st.caption("Use the slider to capture your average exposure to screens each day.")
 
         col_prev, col_spacer, col_next = st.columns([1, 3, 1])
         col_prev.form_submit_button("◀ Back", disabled=True)
-        next_clicked = col_next.form_submit_button("Next →")
+        # Callbacks run before the survey fragment reruns, so it renders the new step directly
+        col_next.form_submit_button("Next →", on_click=submit_digital_step)
 
-    if next_clicked:
-        # Safe: screen_time_hours is NOT a widget key anymore
-        st.session_state["screen_time_hours"] = float(slider_value)
-        go_to_step(1)
-        st.rerun()
+
+def submit_digital_step():
+    # Safe: screen_time_hours is NOT a widget key anymore
+    st.session_state["screen_time_hours"] = float(st.session_state["screen_time_slider"])
+    go_to_step(1)
+
+
+PLATFORM_DEFS = [
+    ("platform_instagram", "Instagram"),
+    ("platform_tiktok", "TikTok"),
+    ("platform_youtube", "YouTube"),
+    ("platform_twitter", "X / Twitter"),
+    ("platform_snapchat", "Snapchat"),
+    ("platform_reddit", "Reddit"),
+    ("platform_facebook", "Facebook"),
+    ("platform_other", "Other / niche"),
+]
 
 
 def render_social_step():
-    prev_clicked = False
-    next_clicked = False
-    
     with st.form("step-social", clear_on_submit=False):
         st.markdown("#### Q2 · Social pulse")
         st.caption("Tap the platforms you actively use in a typical week.")
 
-        platform_defs = [
-            ("platform_instagram", "Instagram"),
-            ("platform_tiktok", "TikTok"),
-            ("platform_youtube", "YouTube"),
-            ("platform_twitter", "X / Twitter"),
-            ("platform_snapchat", "Snapchat"),
-            ("platform_reddit", "Reddit"),
-            ("platform_facebook", "Facebook"),
-            ("platform_other", "Other / niche"),
-        ]
-
         cols = st.columns(3)
-        checkbox_keys = []
-        for idx, (state_key, label) in enumerate(platform_defs):
+        for idx, (state_key, label) in enumerate(PLATFORM_DEFS):
             col = cols[idx % 3]
             col.checkbox(
                 label,
                 value=st.session_state.get(state_key, False),
                 key=state_key
             )
-            checkbox_keys.append(state_key)
 
         # TikTok slider uses its own key; we mirror it into hours_on_TikTok on submit
         tiktok_kwargs = dict(
@@ -1797,29 +2006,23 @@ def render_social_step():
             tiktok_kwargs["value"] = float(st.session_state["hours_on_TikTok"])
         else:
             tiktok_kwargs["value"] = DEFAULT_INPUTS["hours_on_TikTok"]
-        slider_value = st.slider("Hours on TikTok (per day)", **tiktok_kwargs)
+        st.slider("Hours on TikTok (per day)", **tiktok_kwargs)
 
         col_prev, col_spacer, col_next = st.columns([1, 3, 1])
-        prev_clicked = col_prev.form_submit_button("◀ Back")
-        next_clicked = col_next.form_submit_button("Next →")
-
-    if prev_clicked or next_clicked:
-        # Calculate platform count from checkboxes (values are already in session_state)
-        active_count = sum(1 for state_key in checkbox_keys if st.session_state.get(state_key, False))
-        st.session_state["social_media_platforms_used"] = active_count
-        # Mirror TikTok slider value into the feature key used by prediction
-        st.session_state["hours_on_TikTok"] = float(slider_value)
-    
-    if prev_clicked:
-        go_to_step(0)
-        st.rerun()
-    elif next_clicked:
-        go_to_step(2)
-        st.rerun()
+        col_prev.form_submit_button("◀ Back", on_click=submit_social_step, args=(0,))
+        col_next.form_submit_button("Next →", on_click=submit_social_step, args=(2,))
+
+
+def submit_social_step(step_index: int):
+    # Calculate platform count from checkboxes (values are already in session_state)
+    active_count = sum(1 for state_key, _ in PLATFORM_DEFS if st.session_state.get(state_key, False))
+    st.session_state["social_media_platforms_used"] = active_count
+    # Mirror TikTok slider value into the feature key used by prediction
+    st.session_state["hours_on_TikTok"] = float(st.session_state["hours_on_TikTok_slider"])
+    go_to_step(step_index)
 
 
 def render_rest_step():
-    prev_clicked = False
     predict_clicked = False
     
     with st.form("step-rest", clear_on_submit=False):
@@ -1839,21 +2042,24 @@ def render_rest_step():
         sleep_val = st.slider("Sleep hours (per night)", **sleep_kwargs)
 
         col_prev, col_action = st.columns(2)
-        prev_clicked = col_prev.form_submit_button("◀ Back")
+        col_prev.form_submit_button("◀ Back", on_click=go_to_step, args=(1,))
         predict_clicked = col_action.form_submit_button("Predict risk 🔮")
 
-    if prev_clicked:
-        go_to_step(1)
-        st.rerun()
-    elif predict_clicked:
+    if predict_clicked:
         run_prediction()
+        # The page switches from the survey to the results: rerun all of it
         st.rerun()
 
 
-if compact_mode:
-    # Check if all steps are complete (prediction has been run)
-    all_steps_complete = st.session_state.prediction_result is not None
-    render_stepper(current_step, all_complete=all_steps_complete)
+@st.fragment
+def render_survey():
+    """
+    The stepper and the current question. A fragment: moving between steps
+    reruns only this part, not the page styles, hero and results around it.
+    """
+    clamp_step()
+    current_step = st.session_state.survey_step
+    render_stepper(current_step, all_complete=False)
 
     if current_step == 0:
         render_digital_step()
@@ -1863,6 +2069,10 @@ if compact_mode:
         render_rest_step()
 
 
+if compact_mode:
+    render_survey()
+
+
 if st.session_state.last_error:
     st.error(f"Prediction issue: {st.session_state.last_error}")
 
@@ -2,7 +2,8 @@
 Generate Figure 3: Global Feature Importance
 
 Two side-by-side plots:
-- LEFT: Bar chart of Random Forest feature importances
+- LEFT: Bar chart of permutation feature importances with 95% CIs
+  (falls back to Random Forest impurity importances if not cached)
 - RIGHT: SHAP summary plot (beeswarm) with features on y-axis, SHAP values on x-axis
 """
 
@@ -54,8 +55,27 @@ feature_names = json.load(open(feature_names_path))
 print(f"Loaded model: {type(model).__name__}")
 print(f"Feature names: {feature_names}")
 
-# Get feature importances
-feature_importances = model.feature_importances_
+# Get feature importances: prefer the cached permutation importance artifact
+# (written by `python -m src.train`), fall back to impurity-based importances.
+permutation_path = models_dir / "permutation_importance.json"
+importance_errors = None
+if permutation_path.exists():
+    permutation = json.load(open(permutation_path))
+    by_name = {item["feature"]: item for item in permutation["features"]}
+    feature_importances = np.array([by_name[name]["importance_mean"] for name in feature_names])
+    # Asymmetric error bars: rows are the distances down to ci_low and up to ci_high
+    importance_errors = np.array(
+        [
+            [by_name[name]["importance_mean"] - by_name[name]["ci_low"] for name in feature_names],
+            [by_name[name]["ci_high"] - by_name[name]["importance_mean"] for name in feature_names],
+        ]
+    )
+    importance_label = "Permutation Importance (MAE increase)"
+    importance_title = "Permutation Feature Importances"
+else:
+    feature_importances = model.feature_importances_
+    importance_label = "Feature Importance"
+    importance_title = "Random Forest Feature Importances"
 print("\nFeature Importances:")
 for name, imp in zip(feature_names, feature_importances):
     print(f"  {name}: {imp:.4f}")
@@ -124,20 +144,28 @@ sorted_importances = feature_importances[sorted_indices]
 
 # Create horizontal bar chart
 colors = sns.color_palette("husl", len(sorted_names))
-bars = ax1.barh(range(len(sorted_names)), sorted_importances, color=colors, edgecolor='black', linewidth=0.5)
+sorted_errors = importance_errors[:, sorted_indices] if importance_errors is not None else None
+bars = ax1.barh(range(len(sorted_names)), sorted_importances, xerr=sorted_errors,
+                color=colors, edgecolor='black', linewidth=0.5, capsize=4)
 
 # Customize left plot
 ax1.set_yticks(range(len(sorted_names)))
 ax1.set_yticklabels(sorted_names)
-ax1.set_xlabel('Feature Importance', fontweight='bold', fontsize=12)
-ax1.set_title('Random Forest Feature Importances', fontweight='bold', fontsize=13, pad=15)
-ax1.set_xlim(0, max(sorted_importances) * 1.1)
+ax1.set_xlabel(importance_label, fontweight='bold', fontsize=12)
+ax1.set_title(importance_title, fontweight='bold', fontsize=13, pad=15)
+# Permutation importances can be negative (shuffling helped by chance), so the
+# axis only starts at zero when every bar and error bar is non-negative
+x_low = min(0.0, min(sorted_importances - (sorted_errors[0] if sorted_errors is not None else 0)))
+x_high = max(sorted_importances + (sorted_errors[1] if sorted_errors is not None else 0))
+ax1.set_xlim(x_low * 1.1, x_high * 1.1)
+if x_low < 0:
+    ax1.axvline(0, color='black', linewidth=0.8)
 ax1.grid(True, alpha=0.3, linestyle='--', axis='x')
 
 # Add value labels on bars
 for i, (bar, imp) in enumerate(zip(bars, sorted_importances)):
     width = bar.get_width()
-    ax1.text(width + 0.01, bar.get_y() + bar.get_height()/2,
+    ax1.text(max(width, 0) + 0.01, bar.get_y() + bar.get_height()/2,
              f'{imp:.4f}', ha='left', va='center', fontsize=10, fontweight='bold')
 
 # Invert y-axis so highest importance is at top
@@ -0,0 +1,115 @@
+"""
+Batch inference scaling benchmark.
+
+Times FlatForest.predict_with_uncertainty for a range of batch sizes with 1..N
+threads (and the automatic serial/parallel choice), optionally next to sklearn's
+joblib-threaded RandomForestRegressor.predict with the same number of jobs.
+
+Usage:
+    python -m src.benchmark
+    python -m src.benchmark --batch-sizes 1 64 4096 65536 --max-threads 8 --compare-sklearn
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import joblib
+import numpy as np
+
+from .forest import available_cores, choose_threads
+from .utils import get_models_dir
+
+
+def _best_time(fn, repeats: int) -> float:
+    fn()  # warm-up (thread pool start, page faults)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_thread_scaling(
+    forest,
+    X: np.ndarray,
+    batch_sizes: List[int],
+    thread_counts: List[int],
+    repeats: int = 3,
+    model=None,
+) -> List[Dict[str, Any]]:
+    """
+    Rows per second for every (batch size, thread count); thread count "auto"
+    uses choose_threads. With a sklearn model, its predict is timed alongside.
+    """
+    results = []
+    for batch_size in batch_sizes:
+        batch = X[np.arange(batch_size) % X.shape[0]]
+        for n_threads in thread_counts + ["auto"]:
+            threads = None if n_threads == "auto" else n_threads
+            seconds = _best_time(lambda: forest.predict_with_uncertainty(batch, n_threads=threads), repeats)
+            row = {
+                "batch_size": batch_size,
+                "threads": n_threads,
+                "threads_used": choose_threads(batch_size, threads),
+                "seconds": seconds,
+                "rows_per_second": batch_size / seconds,
+            }
+            if model is not None and n_threads != "auto":
+                model.set_params(n_jobs=n_threads)
+                sk_seconds = _best_time(lambda: model.predict(batch), repeats)
+                row["sklearn_seconds"] = sk_seconds
+                row["sklearn_rows_per_second"] = batch_size / sk_seconds
+            results.append(row)
+
+            line = (f"batch {batch_size:>7} | threads {str(n_threads):>4} ({row['threads_used']} used) | "
+                    f"{seconds * 1000:9.2f} ms | {row['rows_per_second']:>11,.0f} rows/s")
+            if "sklearn_seconds" in row:
+                line += f" | sklearn {row['sklearn_seconds'] * 1000:9.2f} ms"
+            print(line)
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark batch inference across thread counts.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64, 1024, 16384, 65536])
+    parser.add_argument(
+        "--max-threads",
+        type=int,
+        default=available_cores(),
+        help="Benchmark 1, 2, 4, ... up to this many threads.",
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--compare-sklearn",
+        action="store_true",
+        help="Also time sklearn's predict (loads the model pickle).",
+    )
+    args = parser.parse_args(argv)
+
+    # Reuse the serving loader so the benchmark measures what predict_batch runs
+    from .predict import get_model_version
+
+    forest = get_model_version().forest
+    model = None
+    if args.compare_sklearn:
+        model = joblib.load(get_models_dir() / "mental_health_model.pkl")
+
+    thread_counts = sorted({min(2 ** k, args.max_threads) for k in range(args.max_threads.bit_length() + 1)})
+
+    from .train import FEATURE_NAMES, load_dataset
+
+    X = load_dataset()[FEATURE_NAMES].values
+    print(f"Benchmarking {type(forest).__name__} ({forest.n_trees} trees) on {available_cores()} available cores")
+    results = benchmark_thread_scaling(forest, X, args.batch_sizes, thread_counts, args.repeats, model=model)
+
+    output_path = get_models_dir() / "thread_scaling.json"
+    with open(output_path, "w") as f:
+        json.dump({"cores": available_cores(), "results": results}, f, indent=2)
+    print(f"Saved benchmark results to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Size- and latency-budgeted Random Forest training.
+
+With the defaults (max_depth=None, min_samples_leaf=1) every tree grows tens of
+thousands of nodes on the 80k training rows, which bloats the pickle, load time
+and cache footprint for very little accuracy. This module searches tree depth,
+leaf size and tree count for the most accurate forest that fits a target
+artifact size and single-row serving latency, prunes trees that do not pull
+their weight on a validation split, and reports the accuracy cost against the
+default configuration.
+"""
+
+import copy
+import json
+import pickle
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import train_test_split
+
+from .forest import FlatForest
+from .utils import atomic_path, get_models_dir
+
+# Candidate tree shapes, searched in order; the first one is the default
+# configuration used by train_model and serves as the accuracy reference.
+BUDGET_GRID = [
+    {"max_depth": max_depth, "min_samples_leaf": min_samples_leaf}
+    for max_depth in (None, 16, 12, 8)
+    for min_samples_leaf in (1, 10, 50)
+]
+
+# Tree counts tried for every shape, largest first
+TREE_COUNTS = (200, 150, 100, 75, 50, 25)
+
+
+def subforest(model, n_trees: int, trees: Optional[List[int]] = None):
+    """Copy of a fitted forest restricted to its first n_trees (or the given) trees."""
+    sub = copy.copy(model)
+    chosen = list(range(n_trees)) if trees is None else list(trees)
+    sub.estimators_ = [model.estimators_[i] for i in chosen]
+    sub.n_estimators = len(sub.estimators_)
+    return sub
+
+
+def measure_single_row_latency_ms(model, x: np.ndarray, repeats: int = 50) -> float:
+    """Median latency of the serving path (FlatForest with uncertainty) for one row."""
+    forest = FlatForest.from_sklearn(model)
+    forest.predict_with_uncertainty(x)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        forest.predict_with_uncertainty(x)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def prune_trees(
+    per_tree_val: np.ndarray,
+    y_val: np.ndarray,
+    tolerance: float = 0.001,
+    min_trees: int = 25,
+) -> List[int]:
+    """
+    Greedy backward elimination: repeatedly drop the tree whose removal hurts
+    validation MAE the least, while MAE stays within `tolerance` (relative) of
+    the unpruned forest. Every candidate removal is scored in one vectorized step.
+
+    At least `min_trees` are kept so per-tree dispersion (prediction uncertainty,
+    anytime early exit) stays meaningful.
+    """
+    kept = list(range(per_tree_val.shape[1]))
+    total = per_tree_val.sum(axis=1)
+    limit = mean_absolute_error(y_val, total / len(kept)) * (1 + tolerance)
+
+    while len(kept) > max(min_trees, 1):
+        candidates = (total[:, None] - per_tree_val[:, kept]) / (len(kept) - 1)
+        maes = np.abs(candidates - y_val[:, None]).mean(axis=0)
+        best = int(np.argmin(maes))
+        if maes[best] > limit:
+            break
+        total = total - per_tree_val[:, kept[best]]
+        kept.pop(best)
+    return kept
+
+
+def train_model_with_budget(
+    X_train: np.ndarray,
+    y_train: np.ndarray,
+    X_test: np.ndarray,
+    y_test: np.ndarray,
+    max_bytes: Optional[float] = None,
+    max_latency_ms: Optional[float] = None,
+    grid: Optional[List[Dict[str, Any]]] = None,
+    tree_counts=TREE_COUNTS,
+    prune_tolerance: float = 0.001,
+    min_trees: int = 25,
+    random_state: int = 42,
+):
+    """
+    Search forest shapes and tree counts for the most accurate model (validation
+    MAE on a slice of the training split) within the byte and latency budgets,
+    prune low-value trees, and report test accuracy against the default config.
+
+    Returns (model, report).
+    """
+    grid = grid or BUDGET_GRID
+    X_fit, X_val, y_fit, y_val = train_test_split(
+        X_train, y_train, test_size=0.1, random_state=random_state
+    )
+    probe = X_val[:1]
+
+    # Only the best candidate so far is kept in memory; the reference model is
+    # reduced to its test predictions as soon as it is fitted.
+    best = None
+    reference = None
+    for params in grid:
+        print(f"Fitting candidate {params}...")
+        model = RandomForestRegressor(
+            n_estimators=max(tree_counts), random_state=random_state, n_jobs=-1, **params
+        )
+        model.fit(X_fit, y_fit)
+
+        tree_bytes = np.array([len(pickle.dumps(tree, protocol=pickle.HIGHEST_PROTOCOL))
+                               for tree in model.estimators_])
+        if reference is None:
+            reference = {
+                "params": params,
+                "bytes": int(tree_bytes.sum()),
+                "test_pred": model.predict(X_test),
+            }
+
+        per_tree_val = np.column_stack([tree.predict(X_val.astype(np.float32)) for tree in model.estimators_])
+        for n_trees in sorted(tree_counts, reverse=True):
+            n_bytes = int(tree_bytes[:n_trees].sum())
+            if max_bytes is not None and n_bytes > max_bytes:
+                continue
+            latency = measure_single_row_latency_ms(subforest(model, n_trees), probe)
+            if max_latency_ms is not None and latency > max_latency_ms:
+                continue
+
+            val_mae = mean_absolute_error(y_val, per_tree_val[:, :n_trees].mean(axis=1))
+            print(f"  {n_trees:>3} trees: {n_bytes / 1e6:8.1f} MB, {latency:6.2f} ms, val MAE {val_mae:.4f}")
+            if best is None or val_mae < best["val_mae"]:
+                best = {
+                    "params": params,
+                    "model": model,
+                    "n_trees": n_trees,
+                    "per_tree_val": per_tree_val[:, :n_trees],
+                    "tree_bytes": tree_bytes,
+                    "val_mae": val_mae,
+                }
+            # Fewer trees of the same shape only lose accuracy
+            break
+        del model
+
+    if best is None:
+        raise ValueError(
+            f"No configuration fits the budget (max_bytes={max_bytes}, max_latency_ms={max_latency_ms})"
+        )
+
+    kept = prune_trees(best["per_tree_val"], y_val, tolerance=prune_tolerance, min_trees=min_trees)
+    model = subforest(best["model"], len(kept), trees=kept)
+    print(f"Selected {best['params']} with {best['n_trees']} trees, pruned to {len(kept)}")
+
+    n_bytes = int(best["tree_bytes"][kept].sum())
+    latency = measure_single_row_latency_ms(model, probe)
+    y_pred = model.predict(X_test)
+    ref_pred = reference["test_pred"]
+
+    report = {
+        "max_bytes": max_bytes,
+        "max_latency_ms": max_latency_ms,
+        "selected_params": best["params"],
+        "n_trees": len(kept),
+        "n_trees_before_pruning": best["n_trees"],
+        "model_bytes": n_bytes,
+        "single_row_latency_ms": latency,
+        "test_mae": float(mean_absolute_error(y_test, y_pred)),
+        "test_r2": float(r2_score(y_test, y_pred)),
+        "reference_params": reference["params"],
+        "reference_bytes": reference["bytes"],
+        "reference_test_mae": float(mean_absolute_error(y_test, ref_pred)),
+        "reference_test_r2": float(r2_score(y_test, ref_pred)),
+    }
+    report["mae_cost"] = report["test_mae"] - report["reference_test_mae"]
+    report["size_ratio"] = n_bytes / reference["bytes"]
+
+    print("===== Budgeted Model =====")
+    print(f"Params:   {report['selected_params']} x {report['n_trees']} trees")
+    print(f"Size:     {n_bytes / 1e6:.1f} MB ({report['size_ratio']:.1%} of default)")
+    print(f"Latency:  {latency:.2f} ms / row")
+    print(f"MAE:      {report['test_mae']:.3f} (default {report['reference_test_mae']:.3f}, "
+          f"cost {report['mae_cost']:+.3f})")
+    print(f"R^2:      {report['test_r2']:.3f} (default {report['reference_test_r2']:.3f})")
+    print("==========================")
+
+    return model, report
+
+
+def save_budget_report(report: Dict[str, Any]):
+    """
+    Save the budget search report to models/budget_report.json.
+    """
+    report_path = get_models_dir() / "budget_report.json"
+    with atomic_path(report_path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved budget report to {report_path}")
@@ -0,0 +1,165 @@
+"""
+Content-addressed build cache for the training pipeline.
+
+Every stage of `python -m src.train` (model + explainer, permutation importance,
+partial dependence, ...) gets a key: a SHA-256 over everything its output depends
+on. That covers the dataset bytes, the feature list, the stage's parameters, the
+source of the modules that compute it, the library versions and, for stages
+downstream of the model, the model's own key. models/manifest.json records each
+stage's key with the hashes of the artifacts it wrote, plus lineage (inputs,
+versions, git commit, timestamps). When a stage's key is unchanged and its
+artifacts still hash to what the manifest recorded, the stage is skipped.
+"""
+
+import hashlib
+import json
+import platform
+import subprocess
+import time
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .utils import atomic_path, get_models_dir, get_project_root
+
+MANIFEST_FILENAME = "manifest.json"
+
+# Libraries whose versions can change a trained artifact
+TRACKED_LIBRARIES = ("numpy", "pandas", "scikit-learn", "shap", "joblib")
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def library_versions() -> Dict[str, Optional[str]]:
+    versions = {"python": platform.python_version()}
+    for name in TRACKED_LIBRARIES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def source_fingerprint(modules: Iterable[str]) -> str:
+    """Hash of the given src/ modules' source, so code changes invalidate their stages."""
+    digest = hashlib.sha256()
+    src_dir = get_project_root() / "src"
+    for module in sorted(modules):
+        digest.update(module.encode())
+        digest.update((src_dir / f"{module}.py").read_bytes())
+    return digest.hexdigest()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=get_project_root(),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def stage_key(inputs: Dict[str, Any]) -> str:
+    """Build key of a stage: SHA-256 of its canonical JSON inputs."""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def load_manifest() -> Dict[str, Any]:
+    """
+    Load models/manifest.json, or an empty manifest if there is none.
+    """
+    manifest_path = get_models_dir() / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return {"stages": {}}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: Dict[str, Any]):
+    """
+    Save the manifest to models/manifest.json.
+    """
+    manifest_path = get_models_dir() / MANIFEST_FILENAME
+    manifest["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with atomic_path(manifest_path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def stage_is_cached(manifest: Dict[str, Any], stage: str, key: str) -> bool:
+    """
+    Whether `stage` was built with this key and all of its artifacts are still
+    present with the recorded content.
+    """
+    record = manifest["stages"].get(stage)
+    if record is None or record["key"] != key:
+        return False
+    models_dir = get_models_dir()
+    for name, artifact in record["artifacts"].items():
+        path = models_dir / name
+        if not path.exists() or path.stat().st_size != artifact["bytes"]:
+            return False
+        if file_sha256(path) != artifact["sha256"]:
+            return False
+    return True
+
+
+def record_stage(
+    manifest: Dict[str, Any],
+    stage: str,
+    key: str,
+    inputs: Dict[str, Any],
+    artifact_names: List[str],
+    seconds: float,
+):
+    """
+    Record a freshly built stage (its key, inputs and artifact hashes) and save
+    the manifest, so an interrupted run keeps the stages it finished.
+    """
+    models_dir = get_models_dir()
+    manifest["stages"][stage] = {
+        "key": key,
+        "inputs": inputs,
+        "artifacts": {
+            name: {
+                "sha256": file_sha256(models_dir / name),
+                "bytes": (models_dir / name).stat().st_size,
+            }
+            for name in artifact_names
+        },
+        "build_seconds": round(seconds, 1),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+    }
+    save_manifest(manifest)
+
+
+def run_stage(
+    manifest: Dict[str, Any],
+    stage: str,
+    inputs: Dict[str, Any],
+    artifact_names: List[str],
+    build: Callable[[], None],
+    use_cache: bool = True,
+) -> Tuple[str, bool]:
+    """
+    Run `build` unless the cache already holds this stage's artifacts for these
+    inputs. Returns (key, rebuilt).
+    """
+    key = stage_key(inputs)
+    if use_cache and stage_is_cached(manifest, stage, key):
+        print(f"Skipping {stage}: artifacts are up to date (key {key[:12]})")
+        return key, False
+    start = time.perf_counter()
+    build()
+    record_stage(manifest, stage, key, inputs, artifact_names, time.perf_counter() - start)
+    return key, True
@@ -0,0 +1,135 @@
+"""
+K-fold cross-validation with folds in parallel worker processes.
+
+The feature matrix and target are written once to .npy files in a temporary
+directory and opened as read-only memory maps. joblib sends a memmap to its
+workers as a reference to the file, so every fold worker reads the same pages
+from the OS cache instead of receiving its own pickled copy of X; only the
+rows a fold actually fits on are materialized inside the worker.
+
+The trainers supply the model through a fit_predict callable (see
+train.fit_predict_forest and train_xgb.fit_predict_xgboost).
+"""
+
+import json
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import KFold
+
+from .forest import available_cores
+from .utils import atomic_path, get_models_dir
+
+# fit_predict(X_train, y_train, X_val, y_val, n_jobs) -> (val predictions, extra fold info)
+FitPredict = Callable[[np.ndarray, np.ndarray, np.ndarray, np.ndarray, int], Tuple[np.ndarray, Dict[str, Any]]]
+
+
+@contextmanager
+def shared_arrays(**arrays: np.ndarray):
+    """
+    Write each array once to a temporary .npy file and yield read-only memmaps
+    of them by name; the files are removed on exit.
+    """
+    with tempfile.TemporaryDirectory(prefix="pulsemind-cv-") as tmp_dir:
+        shared = {}
+        for name, array in arrays.items():
+            path = Path(tmp_dir) / f"{name}.npy"
+            np.save(path, np.ascontiguousarray(array))
+            shared[name] = np.load(path, mmap_mode="r")
+        yield shared
+
+
+def _run_fold(
+    fit_predict: FitPredict,
+    X: np.ndarray,
+    y: np.ndarray,
+    fold: int,
+    train_idx: np.ndarray,
+    val_idx: np.ndarray,
+    n_jobs: int,
+) -> Dict[str, Any]:
+    """Fit and score one fold (runs in a worker; X and y are memmaps)."""
+    start = time.perf_counter()
+    y_pred, info = fit_predict(X[train_idx], y[train_idx], X[val_idx], y[val_idx], n_jobs)
+    seconds = time.perf_counter() - start
+    return {
+        "fold": fold,
+        "n_train": int(len(train_idx)),
+        "n_val": int(len(val_idx)),
+        "mae": float(mean_absolute_error(y[val_idx], y_pred)),
+        "r2": float(r2_score(y[val_idx], y_pred)),
+        "seconds": seconds,
+        **info,
+    }
+
+
+def cross_validate(
+    fit_predict: FitPredict,
+    X: np.ndarray,
+    y: np.ndarray,
+    n_splits: int = 5,
+    n_jobs: int = -1,
+    random_state: int = 42,
+) -> Dict[str, Any]:
+    """
+    Shuffled k-fold cross-validation of fit_predict on (X, y), with up to
+    n_jobs folds running at once (negative values count back from the number of
+    cores as in joblib: -1 = one per core, -2 = all but one). The cores are split
+    between the concurrent folds, and each fold's model gets its share as n_jobs.
+    Returns per-fold metrics and timings plus their mean and std.
+    """
+    if n_jobs == 0:
+        raise ValueError("n_jobs == 0 has no meaning; use a positive count or -1 for one fold per core")
+    n_workers = min(n_splits, max(1, available_cores() + 1 + n_jobs) if n_jobs < 0 else n_jobs)
+    cores_per_fold = max(1, available_cores() // n_workers)
+    splits = list(KFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X))
+
+    print(f"Cross-validating {n_splits} folds in {n_workers} processes ({cores_per_fold} cores each)...")
+    start = time.perf_counter()
+    with shared_arrays(X=X, y=y) as shared:
+        folds = Parallel(n_jobs=n_workers)(
+            delayed(_run_fold)(fit_predict, shared["X"], shared["y"], fold, train_idx, val_idx, cores_per_fold)
+            for fold, (train_idx, val_idx) in enumerate(splits)
+        )
+    wall_seconds = time.perf_counter() - start
+
+    maes = np.array([fold["mae"] for fold in folds])
+    r2s = np.array([fold["r2"] for fold in folds])
+    return {
+        "n_splits": n_splits,
+        "n_rows": int(len(y)),
+        "folds": folds,
+        "mae_mean": float(maes.mean()),
+        "mae_std": float(maes.std(ddof=1)),
+        "r2_mean": float(r2s.mean()),
+        "r2_std": float(r2s.std(ddof=1)),
+        "fold_seconds_total": float(sum(fold["seconds"] for fold in folds)),
+        "wall_seconds": wall_seconds,
+    }
+
+
+def print_cv_report(report: Dict[str, Any], title: str):
+    print(f"===== {title} {report['n_splits']}-fold CV =====")
+    for fold in report["folds"]:
+        print(f"Fold {fold['fold']}: MAE {fold['mae']:.3f} | R^2 {fold['r2']:.3f} | {fold['seconds']:.1f}s")
+    print(f"MAE: {report['mae_mean']:.3f} ± {report['mae_std']:.3f}")
+    print(f"R^2: {report['r2_mean']:.3f} ± {report['r2_std']:.3f}")
+    print(f"Time: {report['wall_seconds']:.1f}s wall for {report['fold_seconds_total']:.1f}s of fold work")
+    print("=" * (len(title) + 22))
+
+
+def save_cv_report(report: Dict[str, Any], filename: str, extra: Optional[Dict[str, Any]] = None):
+    """
+    Save a cross-validation report (plus `extra` fields, e.g. the model
+    parameters) to models/<filename>.
+    """
+    report_path = get_models_dir() / filename
+    with atomic_path(report_path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump({**(extra or {}), **report}, f, indent=2)
+    print(f"Saved cross-validation report to {report_path}")
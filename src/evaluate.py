@@ -0,0 +1,316 @@
+"""
+Evaluation helpers that run after a model has been trained.
+
+Currently:
+- permutation importance on the held-out split, with confidence intervals,
+  saved as a small JSON artifact next to feature_names.json so the app and
+  figure scripts can read a global importance without recomputing it.
+- bootstrap confidence intervals for MAE, R^2 and risk-tier accuracy, overall
+  and per risk tier, for one or more models scored on the same rows; paired
+  differences tell whether a cheaper model is really worse.
+
+Usage (compare serving backends on the held-out split):
+    python -m src.evaluate --backends forest xgboost --resamples 2000
+"""
+
+import argparse
+import json
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.metrics import mean_absolute_error
+
+from .utils import RISK_CATEGORIES, atomic_path, categorize_risk, get_models_dir
+
+PERMUTATION_IMPORTANCE_FILENAME = "permutation_importance.json"
+EVALUATION_FILENAME = "evaluation.json"
+
+# Resamples evaluated together in one vectorized worker task
+BOOTSTRAP_CHUNK = 100
+
+
+def _permuted_mae(model, X: np.ndarray, y: np.ndarray, column: int, seed: int) -> float:
+    """MAE of the model after shuffling a single feature column."""
+    rng = np.random.default_rng(seed)
+    X_permuted = X.copy()
+    X_permuted[:, column] = rng.permutation(X_permuted[:, column])
+    return mean_absolute_error(y, model.predict(X_permuted))
+
+
+def compute_permutation_importance(
+    model,
+    X_test: np.ndarray,
+    y_test: np.ndarray,
+    feature_names: List[str],
+    n_repeats: int = 10,
+    n_jobs: int = -1,
+    random_state: int = 42,
+) -> Dict[str, Any]:
+    """
+    Permutation importance = increase in held-out MAE when a feature is shuffled.
+
+    Every (feature, repeat) shuffle is an independent task, so they are spread
+    across cores with joblib threads (tree prediction releases the GIL, and
+    threads share the model instead of copying it into every worker).
+    Reports the mean increase, its std across repeats and a 95% confidence
+    interval for the mean.
+    """
+    baseline_mae = mean_absolute_error(y_test, model.predict(X_test))
+
+    seeds = np.random.SeedSequence(random_state).generate_state(len(feature_names) * n_repeats)
+    tasks = [
+        (column, int(seeds[column * n_repeats + repeat]))
+        for column in range(len(feature_names))
+        for repeat in range(n_repeats)
+    ]
+
+    print(f"Computing permutation importance ({len(tasks)} shuffles, n_jobs={n_jobs})...")
+    permuted = Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(_permuted_mae)(model, X_test, y_test, column, seed) for column, seed in tasks
+    )
+    increases = np.asarray(permuted).reshape(len(feature_names), n_repeats) - baseline_mae
+
+    means = increases.mean(axis=1)
+    stds = increases.std(axis=1, ddof=1) if n_repeats > 1 else np.zeros(len(feature_names))
+    half_width = 1.96 * stds / np.sqrt(n_repeats)
+
+    # Share of the total (negative importances count as zero) for pie-style displays
+    positive = np.clip(means, 0.0, None)
+    shares = positive / (positive.sum() or 1.0)
+
+    features = []
+    for name, mean, std, hw, share in zip(feature_names, means, stds, half_width, shares):
+        features.append(
+            {
+                "feature": name,
+                "importance_mean": float(mean),
+                "importance_std": float(std),
+                "ci_low": float(mean - hw),
+                "ci_high": float(mean + hw),
+                "share": float(share),
+            }
+        )
+
+    print("===== Permutation Importance (MAE increase) =====")
+    for item in features:
+        print(f"{item['feature']:>28}: {item['importance_mean']:.4f} "
+              f"[{item['ci_low']:.4f}, {item['ci_high']:.4f}]")
+    print("=================================================")
+
+    return {
+        "metric": "mae_increase",
+        "baseline_mae": float(baseline_mae),
+        "n_repeats": int(n_repeats),
+        "n_samples": int(X_test.shape[0]),
+        "features": features,
+    }
+
+
+def save_permutation_importance(importance: Dict[str, Any]):
+    """
+    Save permutation importance to models/permutation_importance.json.
+    """
+    importance_path = get_models_dir() / PERMUTATION_IMPORTANCE_FILENAME
+    with atomic_path(importance_path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(importance, f, indent=2)
+    print(f"Saved permutation importance to {importance_path}")
+
+
+def load_permutation_importance(source=None):
+    """
+    Load models/permutation_importance.json (or the open file `source`), or
+    return None if it has not been computed.
+    """
+    if source is not None:
+        return json.load(source)
+    importance_path = get_models_dir() / PERMUTATION_IMPORTANCE_FILENAME
+    if not importance_path.exists():
+        return None
+    with open(importance_path, "r") as f:
+        return json.load(f)
+
+
+def _bootstrap_chunk(
+    y_true: np.ndarray,
+    predictions: np.ndarray,
+    true_tiers: np.ndarray,
+    pred_tiers: np.ndarray,
+    n_resamples: int,
+    seed: int,
+) -> Dict[str, np.ndarray]:
+    """
+    Metrics of every model on n_resamples bootstrap resamples, in one vectorized
+    pass (runs in a worker). predictions and pred_tiers are (n_models, n_rows).
+    """
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(y_true), size=(n_resamples, len(y_true)))
+    y = y_true[idx]  # (n_resamples, n_rows)
+    tiers = true_tiers[idx]
+    y_centered_ss = ((y - y.mean(axis=1, keepdims=True)) ** 2).sum(axis=1)
+    # (n_tiers, n_resamples, n_rows) membership, shared by all models
+    in_tier = tiers[None, :, :] == np.arange(len(RISK_CATEGORIES))[:, None, None]
+    tier_counts = in_tier.sum(axis=2)
+
+    mae, r2, tier_accuracy, tier_mae = [], [], [], []
+    for pred, pred_tier in zip(predictions, pred_tiers):
+        errors = pred[idx] - y
+        abs_errors = np.abs(errors)
+        mae.append(abs_errors.mean(axis=1))
+        r2.append(1.0 - (errors ** 2).sum(axis=1) / y_centered_ss)
+        tier_accuracy.append((pred_tier[idx] == tiers).mean(axis=1))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            tier_mae.append((abs_errors[None] * in_tier).sum(axis=2) / tier_counts)
+    return {
+        "mae": np.array(mae),  # (n_models, n_resamples)
+        "r2": np.array(r2),
+        "tier_accuracy": np.array(tier_accuracy),
+        "tier_mae": np.array(tier_mae),  # (n_models, n_tiers, n_resamples)
+    }
+
+
+def _interval(samples: np.ndarray, point: float, confidence: float) -> Dict[str, float]:
+    """Point estimate with a percentile bootstrap interval (resamples with an empty tier are ignored)."""
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.nanpercentile(samples, [tail, 100 - tail])
+    return {"value": float(point), "ci_low": float(low), "ci_high": float(high)}
+
+
+def bootstrap_evaluation(
+    y_true: np.ndarray,
+    predictions: Dict[str, np.ndarray],
+    n_resamples: int = 1000,
+    confidence: float = 0.95,
+    n_jobs: int = -1,
+    random_state: int = 42,
+) -> Dict[str, Any]:
+    """
+    Bootstrap confidence intervals for MAE, R^2 and risk-tier accuracy of each
+    model in `predictions` ({name: predicted scores for the rows of y_true}),
+    overall and per true risk tier (tiers from categorize_risk).
+
+    Resamples are split into chunks of BOOTSTRAP_CHUNK that are evaluated as
+    one vectorized step each, across a joblib process pool. Every model is
+    scored on the same resamples, so with several models each later one also
+    gets a paired interval for its MAE difference to the first ("differences"):
+    an interval that excludes 0 is a real difference, not split noise.
+    """
+    names = list(predictions)
+    y_true = np.asarray(y_true, dtype=float)
+    preds = np.array([np.asarray(predictions[name], dtype=float) for name in names])
+    tier_index = {category: i for i, category in enumerate(RISK_CATEGORIES)}
+    true_tiers = np.array([tier_index[categorize_risk(score)] for score in y_true])
+    pred_tiers = np.array([[tier_index[categorize_risk(score)] for score in pred] for pred in preds])
+
+    chunks = [min(BOOTSTRAP_CHUNK, n_resamples - start) for start in range(0, n_resamples, BOOTSTRAP_CHUNK)]
+    seeds = np.random.SeedSequence(random_state).generate_state(len(chunks))
+    print(f"Bootstrapping {n_resamples} resamples of {len(y_true)} rows for {len(names)} model(s) "
+          f"in {len(chunks)} chunks (n_jobs={n_jobs})...")
+    parts = Parallel(n_jobs=n_jobs)(
+        delayed(_bootstrap_chunk)(y_true, preds, true_tiers, pred_tiers, size, int(seed))
+        for size, seed in zip(chunks, seeds)
+    )
+    samples = {key: np.concatenate([part[key] for part in parts], axis=-1) for key in parts[0]}
+
+    models = {}
+    for m, name in enumerate(names):
+        errors = preds[m] - y_true
+        tiers = {}
+        for t, category in enumerate(RISK_CATEGORIES):
+            rows = true_tiers == t
+            if not rows.any():
+                continue
+            tiers[category] = {
+                "n": int(rows.sum()),
+                "mae": _interval(samples["tier_mae"][m, t], np.abs(errors[rows]).mean(), confidence),
+                # Mean signed error: > 0 means the tier's scores are over-predicted
+                "bias": float(errors[rows].mean()),
+                "tier_accuracy": float((pred_tiers[m, rows] == t).mean()),
+            }
+        models[name] = {
+            "mae": _interval(samples["mae"][m], np.abs(errors).mean(), confidence),
+            "r2": _interval(
+                samples["r2"][m], 1 - (errors ** 2).sum() / ((y_true - y_true.mean()) ** 2).sum(), confidence
+            ),
+            "tier_accuracy": _interval(samples["tier_accuracy"][m], (pred_tiers[m] == true_tiers).mean(), confidence),
+            "tiers": tiers,
+        }
+
+    differences = {}
+    for m, name in enumerate(names[1:], start=1):
+        diff = samples["mae"][m] - samples["mae"][0]
+        differences[f"{name} - {names[0]}"] = {
+            "mae": _interval(diff, models[name]["mae"]["value"] - models[names[0]]["mae"]["value"], confidence),
+            "share_of_resamples_worse": float((diff > 0).mean()),
+        }
+
+    return {
+        "n_samples": int(len(y_true)),
+        "n_resamples": int(n_resamples),
+        "confidence": confidence,
+        "models": models,
+        "differences": differences,
+    }
+
+
+def print_bootstrap_evaluation(evaluation: Dict[str, Any]):
+    """Print the intervals of bootstrap_evaluation as a table."""
+    level = f"{evaluation['confidence']:.0%} CI"
+
+    def fmt(interval):
+        return f"{interval['value']:.3f} [{interval['ci_low']:.3f}, {interval['ci_high']:.3f}]"
+
+    print(f"===== Bootstrap Evaluation ({evaluation['n_resamples']} resamples, {level}) =====")
+    for name, metrics in evaluation["models"].items():
+        print(f"{name}: MAE {fmt(metrics['mae'])} | R^2 {fmt(metrics['r2'])} | "
+              f"tier accuracy {fmt(metrics['tier_accuracy'])}")
+        for category, tier in metrics["tiers"].items():
+            print(f"  {category:>8} (n={tier['n']:>6}): MAE {fmt(tier['mae'])}, bias {tier['bias']:+.3f}, "
+                  f"tier accuracy {tier['tier_accuracy']:.3f}")
+    for label, diff in evaluation["differences"].items():
+        print(f"MAE {label}: {fmt(diff['mae'])} (worse in {diff['share_of_resamples_worse']:.0%} of resamples)")
+    print("=" * 60)
+
+
+def save_evaluation(evaluation: Dict[str, Any]):
+    """
+    Save a bootstrap evaluation to models/evaluation.json.
+    """
+    evaluation_path = get_models_dir() / EVALUATION_FILENAME
+    with atomic_path(evaluation_path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(evaluation, f, indent=2)
+    print(f"Saved evaluation to {evaluation_path}")
+
+
+def main(argv: Optional[List[str]] = None):
+    # predict loads the models through model_manager, which imports this module
+    from .predict import predict_batch
+    from .train import FEATURE_NAMES, load_dataset, split_dataset
+
+    parser = argparse.ArgumentParser(
+        description="Compare serving backends on the held-out split with bootstrap confidence intervals."
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=["forest", "xgboost", "ensemble"],
+        default=["forest"],
+        help="Backends to evaluate; later ones are compared against the first.",
+    )
+    parser.add_argument("--resamples", type=int, default=1000, help="Bootstrap resamples.")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals.")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Worker processes (-1 = all cores).")
+    args = parser.parse_args(argv)
+
+    print("Loading dataset...")
+    _, X_test, _, y_test = split_dataset(load_dataset(), FEATURE_NAMES)
+    predictions = {backend: predict_batch(X_test, backend=backend)["predicted_score"] for backend in args.backends}
+
+    evaluation = bootstrap_evaluation(
+        y_test, predictions, n_resamples=args.resamples, confidence=args.confidence, n_jobs=args.n_jobs
+    )
+    print_bootstrap_evaluation(evaluation)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+"What happens if I change one habit?" explanations built on the trained forest.
+
+Partial dependence (PD) is the population-average prediction as one feature is
+swept over a grid with the others held at their observed values; an ICE curve is
+the same sweep for a single user. Both are computed by building the whole grid of
+perturbed inputs up front and scoring it with one batched `predict` call.
+
+Population PD curves are cached at training time in
+models/partial_dependence.json; a user's ICE curves are cheap enough to compute
+on demand.
+
+Counterfactual search answers the follow-up question: what is the smallest
+combination of habit changes that moves the prediction into the next risk tier?
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .utils import (
+    FEATURE_RANGES,
+    INTEGER_FEATURES,
+    RISK_THRESHOLDS,
+    atomic_path,
+    categorize_risk,
+    get_models_dir,
+)
+
+PARTIAL_DEPENDENCE_FILENAME = "partial_dependence.json"
+
+# Grid resolution for continuous features (hours); integer features use every value
+GRID_STEP_HOURS = 0.5
+
+# Largest change we are willing to suggest per habit, and the search step for it.
+# The sign is the healthy direction: only less screen time, fewer platforms, less
+# TikTok and more sleep are suggested, never the reverse (even where forest noise
+# makes the reverse cross a threshold).
+COUNTERFACTUAL_DELTAS = {
+    "screen_time_hours": (-6.0, 0.5),
+    "social_media_platforms_used": (-3, 1),
+    "hours_on_TikTok": (-4.0, 0.5),
+    "sleep_hours": (3.0, 0.5),
+}
+
+
+def feature_grid(name: str, step: float = GRID_STEP_HOURS) -> np.ndarray:
+    """Evenly spaced values covering the valid range of a feature."""
+    low, high = FEATURE_RANGES[name]
+    if name in INTEGER_FEATURES:
+        return np.arange(low, high + 1, dtype=float)
+    return np.round(np.arange(low, high + step / 2, step), 6)
+
+
+def default_grids(feature_names: List[str]) -> Dict[str, np.ndarray]:
+    return {name: feature_grid(name) for name in feature_names}
+
+
+def compute_partial_dependence(
+    model,
+    X_background: np.ndarray,
+    feature_names: List[str],
+    grids: Optional[Dict[str, np.ndarray]] = None,
+) -> Dict[str, Any]:
+    """
+    Population PD curves (plus 10th/90th percentile ICE bands) for every feature.
+
+    For each feature the background rows are tiled once per grid value, the
+    feature column is overwritten with the grid, and the whole
+    (n_grid * n_background, n_features) matrix is scored in a single predict.
+    """
+    grids = grids or default_grids(feature_names)
+    n_background = X_background.shape[0]
+
+    curves = {}
+    for column, name in enumerate(feature_names):
+        grid = np.asarray(grids[name], dtype=float)
+
+        X_grid = np.tile(X_background, (grid.size, 1))
+        X_grid[:, column] = np.repeat(grid, n_background)
+
+        ice = model.predict(X_grid).reshape(grid.size, n_background)
+        curves[name] = {
+            "grid": grid.tolist(),
+            "pd": ice.mean(axis=1).tolist(),
+            "ice_p10": np.percentile(ice, 10, axis=1).tolist(),
+            "ice_p90": np.percentile(ice, 90, axis=1).tolist(),
+        }
+
+    return {
+        "feature_names": list(feature_names),
+        "n_background": int(n_background),
+        "curves": curves,
+    }
+
+
+def compute_ice_curves(
+    model,
+    x: np.ndarray,
+    feature_names: List[str],
+    grids: Dict[str, np.ndarray],
+) -> Dict[str, Dict[str, List[float]]]:
+    """
+    ICE curves for a single input row `x` across all features in one vectorized call.
+
+    The grids of every feature are stacked into one matrix of perturbed copies
+    of `x`, scored with one predict, and split back per feature.
+    """
+    feature_grids = [np.asarray(grids[name], dtype=float) for name in feature_names]
+
+    blocks = []
+    for column, grid in enumerate(feature_grids):
+        block = np.repeat(x.reshape(1, -1), grid.size, axis=0)
+        block[:, column] = grid
+        blocks.append(block)
+
+    predictions = model.predict(np.vstack(blocks))
+
+    curves = {}
+    offset = 0
+    for name, grid in zip(feature_names, feature_grids):
+        curves[name] = {
+            "grid": grid.tolist(),
+            "ice": predictions[offset:offset + grid.size].tolist(),
+        }
+        offset += grid.size
+    return curves
+
+
+def _candidate_changes(x: np.ndarray, feature_names: List[str]):
+    """
+    Every combination of bounded per-feature deltas in the healthy direction that
+    keeps the input in its valid range, with a cost (total hours / platforms
+    changed) per candidate.
+    """
+    axes = []
+    for column, name in enumerate(feature_names):
+        max_delta, step = COUNTERFACTUAL_DELTAS.get(name, (0.0, 1.0))
+        deltas = np.sign(max_delta) * np.arange(0.0, abs(max_delta) + step / 2, step)
+        low, high = FEATURE_RANGES[name]
+        feasible = (x[column] + deltas >= low) & (x[column] + deltas <= high)
+        axes.append(deltas[feasible])
+
+    deltas = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, len(feature_names))
+    costs = np.abs(deltas).sum(axis=1)
+    # Among equal costs prefer touching fewer habits
+    n_changed = np.count_nonzero(deltas, axis=1)
+    order = np.lexsort((n_changed, costs))
+    return deltas[order], costs[order]
+
+
+def _select_counterfactuals(best: Dict[tuple, tuple], top_k: int) -> List[tuple]:
+    """
+    The top_k cheapest (cost, delta row, score) entries of `best`, skipping any
+    that is a cheaper kept one plus extra changes.
+    """
+    selected = []
+    for cost, delta, score in sorted(best.values(), key=lambda item: item[0]):
+        if any(np.all((kept == 0) | (kept == delta)) for _, kept, _ in selected):
+            continue
+        selected.append((cost, delta, score))
+        if len(selected) == top_k:
+            break
+    return selected
+
+
+def find_counterfactuals(
+    model,
+    x: np.ndarray,
+    feature_names: List[str],
+    current_score: float,
+    top_k: int = 3,
+    first_batch_size: int = 256,
+    max_batch_size: int = 8192,
+) -> Dict[str, Any]:
+    """
+    Find the smallest habit changes predicted to lift the score over the next
+    risk threshold.
+
+    All feasible candidate changes are enumerated up front and sorted by cost,
+    then scored in cost-ordered batches (doubling in size) with one vectorized
+    predict per batch. The search stops as soon as the remaining candidates
+    cannot beat the current top-k, so easy cases touch only the first small
+    batch. Results keep only the cheapest change for each set of habits and drop
+    changes that merely add habits on top of a cheaper suggestion.
+    """
+    higher = [t for t in RISK_THRESHOLDS if t > current_score]
+    if not higher:
+        return {
+            "target_threshold": None,
+            "target_category": None,
+            "candidates_evaluated": 0,
+            "counterfactuals": [],
+        }
+    target = float(min(higher))
+
+    deltas, costs = _candidate_changes(x, feature_names)
+    # Drop the no-change candidate
+    deltas, costs = deltas[1:], costs[1:]
+
+    best = {}  # changed-feature set -> (cost, delta row, score)
+    start, batch_size = 0, first_batch_size
+    while start < len(deltas):
+        # Count only suggestions that survive the superset filter: candidates are
+        # scored in cost order, so later ones can neither dominate nor undercut them
+        selected = _select_counterfactuals(best, top_k)
+        if len(selected) == top_k and costs[start] > selected[-1][0]:
+            break
+
+        batch = deltas[start:start + batch_size]
+        scores = model.predict(x + batch)
+
+        for row in np.flatnonzero(scores >= target):
+            key = tuple(np.flatnonzero(batch[row]))
+            if key not in best or costs[start + row] < best[key][0]:
+                best[key] = (float(costs[start + row]), batch[row], float(scores[row]))
+
+        start += batch.shape[0]
+        batch_size = min(batch_size * 2, max_batch_size)
+
+    counterfactuals = []
+    selected = _select_counterfactuals(best, top_k)
+    for cost, delta, score in selected:
+        changes = [
+            {
+                "feature": feature_names[column],
+                "from": float(x[column]),
+                "to": float(x[column] + delta[column]),
+                "delta": float(delta[column]),
+            }
+            for column in np.flatnonzero(delta)
+        ]
+        counterfactuals.append(
+            {
+                "changes": changes,
+                "cost": cost,
+                "predicted_score": score,
+                "risk_category": categorize_risk(score),
+            }
+        )
+
+    return {
+        "target_threshold": target,
+        "target_category": categorize_risk(target),
+        "candidates_evaluated": int(start),
+        "counterfactuals": counterfactuals,
+    }
+
+
+def save_partial_dependence(partial_dependence: Dict[str, Any]):
+    """
+    Save population PD curves to models/partial_dependence.json.
+    """
+    pd_path = get_models_dir() / PARTIAL_DEPENDENCE_FILENAME
+    with atomic_path(pd_path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(partial_dependence, f, indent=2)
+    print(f"Saved partial dependence curves to {pd_path}")
+
+
+def load_partial_dependence(source=None):
+    """
+    Load models/partial_dependence.json (or the open file `source`), or return
+    None if it has not been computed.
+    """
+    if source is not None:
+        return json.load(source)
+    pd_path = get_models_dir() / PARTIAL_DEPENDENCE_FILENAME
+    if not pd_path.exists():
+        return None
+    with open(pd_path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,455 @@
+"""
+Random forest flattened into contiguous NumPy node arrays.
+
+sklearn evaluates a forest tree by tree, with per-call validation and thread
+dispatch that dominate the cost of scoring one request. Here every tree's nodes
+are concatenated into flat arrays (feature, threshold, children, leaf value) and
+any subset of trees is evaluated for a batch of rows with vectorized steps: one
+gather/compare/child-lookup per tree level over all (row, tree) pairs at once.
+Leaves point to themselves, and finished pairs are dropped as they arrive.
+
+Traversal matches sklearn exactly: inputs are cast to float32 before being
+compared with the (float64) split thresholds, as sklearn's trees do.
+
+QuantizedForest stores the same trees compactly: every split threshold becomes
+its rank among that feature's distinct thresholds (uint8/uint16), leaf values
+are float32 or float16, and each request's features are mapped to those ranks
+once, so traversal compares small integers.
+
+A multi-output forest (trained on the score's components, see
+utils.SCORE_COMPONENTS) keeps each leaf's component values in component_values,
+and its `value` is the weighted sum of them, i.e. the leaf's score. Everything
+that works on scores is unchanged, and the components of a prediction come from
+the same leaves.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .utils import (
+    RISK_CATEGORIES,
+    RISK_THRESHOLDS,
+    SCORE_COMPONENT_WEIGHTS,
+    atomic_path,
+    categorize_risk,
+    get_models_dir,
+)
+
+QUANTIZED_FOREST_FILENAME = "quantized_forest.npz"
+
+# Below this many rows per thread, dispatching to the pool costs more than the
+# traversal it parallelizes, so smaller batches run on the calling thread.
+PARALLEL_MIN_ROWS_PER_THREAD = 512
+
+# ---- Persistent thread pool for batch inference ----
+# The traversal is a sequence of large NumPy gathers/compares that release the
+# GIL, so threads scale across cores without copying the forest into processes.
+_THREAD_POOL = None
+_THREAD_POOL_SIZE = 0
+_THREAD_POOL_LOCK = threading.Lock()
+
+
+def available_cores() -> int:
+    """Cores this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _get_thread_pool(n_threads: int) -> ThreadPoolExecutor:
+    """
+    The shared inference pool, sized for all cores up front and replaced by a
+    larger one only if more threads than that are requested.
+    """
+    global _THREAD_POOL, _THREAD_POOL_SIZE
+
+    with _THREAD_POOL_LOCK:
+        if _THREAD_POOL is None or _THREAD_POOL_SIZE < n_threads:
+            # The replaced pool is never shut down: another thread may be about to
+            # map on it. Its workers exit on their own once the last reference is gone.
+            _THREAD_POOL_SIZE = max(n_threads, available_cores())
+            _THREAD_POOL = ThreadPoolExecutor(max_workers=_THREAD_POOL_SIZE, thread_name_prefix="forest")
+        return _THREAD_POOL
+
+
+def choose_threads(n_rows: int, n_threads: Optional[int] = None) -> int:
+    """
+    Threads to use for a batch: at most n_threads (default: all available cores),
+    and only as many as keep PARALLEL_MIN_ROWS_PER_THREAD rows on each.
+    """
+    limit = available_cores() if n_threads is None else n_threads
+    return max(1, min(limit, n_rows // PARALLEL_MIN_ROWS_PER_THREAD))
+
+DEFAULT_QUANTILES = (0.05, 0.5, 0.95)
+
+
+class FlatForest:
+    """A fitted RandomForestRegressor's trees as flat node arrays."""
+
+    def __init__(self, feature, threshold, children, value, roots, depths, component_values=None):
+        self.feature = feature
+        self.threshold = threshold
+        # children[2 * node] is the left child, children[2 * node + 1] the right one
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.depths = depths
+        # (n_nodes, n_components) for multi-output forests, else None
+        self.component_values = component_values
+        self.is_leaf = children[0::2] == np.arange(feature.size)
+
+    @classmethod
+    def from_sklearn(cls, model, component_weights: Sequence[float] = SCORE_COMPONENT_WEIGHTS) -> "FlatForest":
+        """
+        Flatten a fitted forest. A multi-output forest's leaf value is the
+        component_weights-weighted sum of its outputs.
+        """
+        multi_output = model.n_outputs_ > 1
+        if multi_output and len(component_weights) != model.n_outputs_:
+            raise ValueError(f"{len(component_weights)} component weights for {model.n_outputs_} outputs")
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        sizes = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+        feature, threshold, children, value, components = [], [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            is_leaf = tree.children_left == -1
+            own_index = np.arange(tree.node_count) + offset
+            # Leaves loop back to themselves: feature 0 with an infinite threshold
+            # always goes left, i.e. stays put.
+            feature.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left = np.where(is_leaf, own_index, tree.children_left + offset)
+            right = np.where(is_leaf, own_index, tree.children_right + offset)
+            children.append(np.column_stack([left, right]).ravel().astype(np.int32))
+            if multi_output:
+                components.append(tree.value[:, :, 0])
+                value.append(tree.value[:, :, 0] @ np.asarray(component_weights, dtype=float))
+            else:
+                value.append(tree.value[:, 0, 0])
+
+        return cls(
+            feature=np.concatenate(feature),
+            threshold=np.concatenate(threshold),
+            children=np.concatenate(children),
+            value=np.concatenate(value),
+            roots=offsets.astype(np.int32),
+            depths=np.array([tree.max_depth for tree in trees]),
+            component_values=np.concatenate(components) if multi_output else None,
+        )
+
+    @property
+    def n_trees(self) -> int:
+        return self.roots.size
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.feature, self.threshold, self.children, self.value, self.roots, self.is_leaf]
+        if self.component_values is not None:
+            arrays.append(self.component_values)
+        return sum(a.nbytes for a in arrays)
+
+    def encode(self, X: np.ndarray) -> np.ndarray:
+        """Inputs in the form traversal compares against `threshold`: float32 rows."""
+        return np.atleast_2d(np.asarray(X, dtype=np.float32))
+
+    def apply(self, X: np.ndarray, trees: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Global leaf index reached by every row in every selected tree, shape (n_rows, n_trees)."""
+        return self._apply_encoded(self.encode(X), trees)
+
+    def _apply_encoded(self, X: np.ndarray, trees: Optional[Sequence[int]] = None) -> np.ndarray:
+        trees = np.arange(self.n_trees) if trees is None else np.asarray(trees)
+        n_rows, n_features = X.shape
+        n_pairs = n_rows * trees.size
+
+        # Walk all (row, tree) pairs as one flat vector; pairs that reached a leaf
+        # are compacted away every couple of levels, so the work tracks the real
+        # path lengths rather than the deepest tree.
+        X_flat = X.ravel()
+        node = np.tile(self.roots[trees], n_rows).astype(np.int64)
+        row_offset = np.repeat(np.arange(n_rows, dtype=np.int64) * n_features, trees.size)
+        position = np.arange(n_pairs)
+        leaves = np.empty(n_pairs, dtype=np.int64)
+
+        max_depth = int(self.depths[trees].max())
+        level = 0
+        while position.size:
+            go_right = X_flat[row_offset + self.feature[node]] > self.threshold[node]
+            node = self.children[2 * node + go_right]
+            level += 1
+            if level % 2 == 0 or level >= max_depth:
+                done = self.is_leaf[node]
+                leaves[position[done]] = node[done]
+                keep = ~done
+                position, node, row_offset = position[keep], node[keep], row_offset[keep]
+        return leaves.reshape(n_rows, trees.size)
+
+    def predict_trees(self, X: np.ndarray, trees: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Per-tree predictions, shape (n_rows, n_trees)."""
+        return self._predict_trees_encoded(self.encode(X), trees)
+
+    def _predict_trees_encoded(self, X: np.ndarray, trees: Optional[Sequence[int]] = None) -> np.ndarray:
+        return self.value[self._apply_encoded(X, trees)].astype(np.float64, copy=False)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Forest prediction (mean over trees); matches the sklearn model up to float rounding."""
+        return self.predict_trees(X).mean(axis=1)
+
+    def predict_with_uncertainty(
+        self,
+        X: np.ndarray,
+        quantiles: Sequence[float] = DEFAULT_QUANTILES,
+        chunk_size: int = 4096,
+        n_threads: Optional[int] = None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Forest prediction plus its spread across trees, from the same per-tree
+        outputs (one traversal, no second pass).
+
+        Returns arrays over rows: 'mean' (the forest prediction), 'std' across
+        trees, 'quantiles' (n_rows, len(quantiles)) and 'tier_probabilities'
+        (n_rows, len(RISK_CATEGORIES)): the share of trees whose prediction
+        falls in each risk tier. Multi-output forests also return 'components'
+        (n_rows, n_components), the forest's prediction of each score component,
+        from the same leaves. Rows are processed in chunks so the per-tree
+        matrix stays small for very large batches.
+
+        Large batches are partitioned by rows across the persistent thread pool
+        (see choose_threads; n_threads=1 forces serial execution). Every chunk
+        writes its own slice of the outputs, so threads share no accumulators.
+        """
+        X = self.encode(X)
+        n_rows = X.shape[0]
+        thresholds = np.asarray(RISK_THRESHOLDS, dtype=float)
+        n_tiers = len(RISK_CATEGORIES)
+
+        mean = np.empty(n_rows)
+        std = np.empty(n_rows)
+        quantile_values = np.empty((n_rows, len(quantiles)))
+        tier_probabilities = np.empty((n_rows, n_tiers))
+        components = None
+        if self.component_values is not None:
+            components = np.empty((n_rows, self.component_values.shape[1]))
+
+        def fill(start: int, stop: int):
+            leaves = self._apply_encoded(X[start:stop])
+            outputs = self.value[leaves].astype(np.float64, copy=False)
+            mean[start:stop] = outputs.mean(axis=1)
+            std[start:stop] = outputs.std(axis=1)
+            quantile_values[start:stop] = np.quantile(outputs, quantiles, axis=1).T
+
+            # Tier index per tree output, counted per row
+            tiers = np.searchsorted(thresholds, outputs, side="right")
+            flat = (np.arange(stop - start)[:, None] * n_tiers + tiers).ravel()
+            counts = np.bincount(flat, minlength=(stop - start) * n_tiers)
+            tier_probabilities[start:stop] = counts.reshape(-1, n_tiers) / outputs.shape[1]
+
+            if components is not None:
+                components[start:stop] = self.component_values[leaves].mean(axis=1)
+
+        n_threads = choose_threads(n_rows, n_threads)
+        if n_threads > 1:
+            # At least one chunk per thread
+            chunk_size = min(chunk_size, -(-n_rows // n_threads))
+        spans = [(start, min(start + chunk_size, n_rows)) for start in range(0, n_rows, chunk_size)]
+
+        if n_threads == 1:
+            for start, stop in spans:
+                fill(start, stop)
+        else:
+            # One task per thread, each working through its share of the chunks,
+            # so at most n_threads run even if the shared pool is larger
+            def fill_all(group):
+                for start, stop in group:
+                    fill(start, stop)
+
+            groups = [spans[i::n_threads] for i in range(n_threads)]
+            # list() re-raises any worker exception here
+            list(_get_thread_pool(n_threads).map(fill_all, groups))
+
+        output = {
+            "mean": mean,
+            "std": std,
+            "quantiles": quantile_values,
+            "tier_probabilities": tier_probabilities,
+        }
+        if components is not None:
+            output["components"] = components
+        return output
+
+    def predict_anytime(
+        self,
+        X: np.ndarray,
+        block_size: int = 8,
+        min_trees: int = 16,
+        z: float = 3.0,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Evaluate trees in a fixed order, a block at a time, and stop for each row
+        once its risk tier is settled.
+
+        After n of T trees with running mean m and per-tree std s, the full-forest
+        mean differs from m with standard deviation s * sqrt((T - n) / (T * n))
+        (sampling without replacement from the forest's trees). A row stops when
+        no categorize_risk threshold lies within z of those deviations from m;
+        at n = T the deviation is zero and the result is exact.
+        """
+        X = self.encode(X)
+        n_rows, n_total = X.shape[0], self.n_trees
+        thresholds = np.asarray(RISK_THRESHOLDS, dtype=float)
+
+        sums = np.zeros(n_rows)
+        sq_sums = np.zeros(n_rows)
+        evaluated = np.zeros(n_rows, dtype=int)
+        active = np.arange(n_rows)
+
+        for start in range(0, n_total, block_size):
+            trees = np.arange(start, min(start + block_size, n_total))
+            outputs = self._predict_trees_encoded(X[active], trees)
+            sums[active] += outputs.sum(axis=1)
+            sq_sums[active] += np.square(outputs).sum(axis=1)
+            evaluated[active] += trees.size
+
+            n = evaluated[active]
+            if n[0] < min(min_trees, n_total):
+                continue
+            mean = sums[active] / n
+            std = np.sqrt(np.maximum(sq_sums[active] / n - mean ** 2, 0.0) * n / np.maximum(n - 1, 1))
+            deviation = z * std * np.sqrt((n_total - n) / (n_total * n))
+            undecided = np.any(np.abs(mean[:, None] - thresholds[None, :]) <= deviation[:, None], axis=1)
+            active = active[undecided]
+            if active.size == 0:
+                break
+
+        scores = sums / evaluated
+        return {
+            "scores": scores,
+            "risk_categories": np.array([categorize_risk(score) for score in scores]),
+            "trees_evaluated": evaluated,
+        }
+
+
+class QuantizedForest(FlatForest):
+    """
+    FlatForest with integer thresholds and compact leaf values.
+
+    bin_edges[j] holds the sorted distinct thresholds of feature j. A feature
+    value is encoded as the number of those thresholds strictly below it, and a
+    node's threshold as its own position in the list, so "x > threshold" holds
+    exactly when code > rank: splits are identical to the float traversal. Leaves
+    get the dtype's maximum rank, which no code reaches, so they stay put.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, depths, bin_edges, component_values=None):
+        super().__init__(feature, threshold, children, value, roots, depths, component_values)
+        self.bin_edges = bin_edges
+
+    @classmethod
+    def from_flat(
+        cls,
+        forest: FlatForest,
+        n_features: Optional[int] = None,
+        value_dtype: str = "float32",
+    ) -> "QuantizedForest":
+        if n_features is None:
+            n_features = int(forest.feature[~forest.is_leaf].max()) + 1
+        bin_edges = [
+            np.unique(forest.threshold[~forest.is_leaf & (forest.feature == j)])
+            for j in range(n_features)
+        ]
+
+        largest = max(edges.size for edges in bin_edges)
+        code_dtype = np.uint8 if largest < np.iinfo(np.uint8).max else np.uint16
+        if largest >= np.iinfo(code_dtype).max:
+            raise ValueError(f"Too many distinct thresholds to quantize ({largest})")
+
+        rank = np.full(forest.feature.size, np.iinfo(code_dtype).max, dtype=code_dtype)
+        for j, edges in enumerate(bin_edges):
+            nodes = ~forest.is_leaf & (forest.feature == j)
+            rank[nodes] = np.searchsorted(edges, forest.threshold[nodes])
+
+        return cls(
+            feature=forest.feature.astype(np.uint8),
+            threshold=rank,
+            children=forest.children,
+            value=forest.value.astype(value_dtype),
+            roots=forest.roots,
+            depths=forest.depths,
+            bin_edges=bin_edges,
+            component_values=(
+                forest.component_values.astype(value_dtype) if forest.component_values is not None else None
+            ),
+        )
+
+    @classmethod
+    def from_sklearn(cls, model, value_dtype: str = "float32") -> "QuantizedForest":
+        return cls.from_flat(
+            FlatForest.from_sklearn(model), n_features=model.n_features_in_, value_dtype=value_dtype
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + sum(edges.nbytes for edges in self.bin_edges)
+
+    def encode(self, X: np.ndarray) -> np.ndarray:
+        """Map each feature value to its threshold rank, once per request."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        codes = np.empty(X.shape, dtype=self.threshold.dtype)
+        for j, edges in enumerate(self.bin_edges):
+            codes[:, j] = np.searchsorted(edges, X[:, j], side="left")
+        return codes
+
+
+def save_quantized_forest(forest: QuantizedForest, feature_names: List[str]):
+    """
+    Save the quantized forest's node arrays to models/quantized_forest.npz, so
+    serving can score without unpickling the sklearn model.
+    """
+    forest_path = get_models_dir() / QUANTIZED_FOREST_FILENAME
+    extra = {}
+    if forest.component_values is not None:
+        extra["component_values"] = forest.component_values
+    with atomic_path(forest_path) as tmp_path:
+        np.savez(
+            tmp_path,
+            feature_names=np.array(feature_names),
+            feature=forest.feature,
+            threshold=forest.threshold,
+            children=forest.children,
+            value=forest.value,
+            roots=forest.roots,
+            depths=forest.depths,
+            **{f"bin_edges_{j}": edges for j, edges in enumerate(forest.bin_edges)},
+            **extra,
+        )
+    print(f"Saved quantized forest ({forest.nbytes / 1e6:.0f} MB in memory, "
+          f"{forest.threshold.dtype} thresholds, {forest.value.dtype} leaves) to {forest_path}")
+
+
+def load_quantized_forest(source=None):
+    """
+    Load models/quantized_forest.npz (or the open file `source`) as
+    (forest, feature_names), or return None if it has not been written.
+    """
+    if source is None:
+        source = get_models_dir() / QUANTIZED_FOREST_FILENAME
+        if not source.exists():
+            return None
+    with np.load(source) as data:
+        feature_names = [str(name) for name in data["feature_names"]]
+        n_edges = sum(key.startswith("bin_edges_") for key in data.files)
+        forest = QuantizedForest(
+            feature=data["feature"],
+            threshold=data["threshold"],
+            children=data["children"],
+            value=data["value"],
+            roots=data["roots"],
+            depths=data["depths"],
+            bin_edges=[data[f"bin_edges_{j}"] for j in range(n_edges)],
+            component_values=data["component_values"] if "component_values" in data.files else None,
+        )
+    return forest, feature_names
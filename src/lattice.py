@@ -0,0 +1,186 @@
+"""
+Dense precomputed prediction lattice.
+
+The input domain is tiny and bounded (see FEATURE_RANGES), so the forest can be
+evaluated once over a regular 4-D grid and stored as a compact tensor. Serving
+then becomes a direct index (nearest grid point) or a multilinear interpolation
+of the 2^d surrounding grid points: O(1) per request and independent of the
+forest's size.
+
+With a 0.1-hour step the grid contains every value the app's sliders can
+produce, so nearest-point lookups are exact for those inputs.
+"""
+
+from typing import Any, Dict, List
+
+import numpy as np
+
+from .utils import FEATURE_RANGES, INTEGER_FEATURES, atomic_path, categorize_risk, get_models_dir
+
+LATTICE_FILENAME = "prediction_lattice.npz"
+
+
+def lattice_axes(feature_names: List[str], step: float) -> List[np.ndarray]:
+    """Grid points per feature: every `step` hours, every integer for count features."""
+    axes = []
+    for name in feature_names:
+        low, high = FEATURE_RANGES[name]
+        if name in INTEGER_FEATURES:
+            axes.append(np.arange(low, high + 1, dtype=float))
+        else:
+            axes.append(np.round(np.arange(low, high + step / 2, step), 6))
+    return axes
+
+
+def build_lattice(
+    model,
+    feature_names: List[str],
+    step: float = 0.25,
+    dtype: str = "float32",
+    chunk_size: int = 200_000,
+) -> Dict[str, Any]:
+    """
+    Evaluate the model at every grid point, in chunks to bound memory.
+    """
+    axes = lattice_axes(feature_names, step)
+    shape = tuple(axis.size for axis in axes)
+    n_points = int(np.prod(shape))
+    print(f"Evaluating {n_points:,} lattice points (grid {shape}, step={step})...")
+
+    values = np.empty(n_points, dtype=np.float64)
+    for start in range(0, n_points, chunk_size):
+        stop = min(start + chunk_size, n_points)
+        index = np.unravel_index(np.arange(start, stop), shape)
+        X = np.column_stack([axis[i] for axis, i in zip(axes, index)])
+        values[start:stop] = model.predict(X)
+
+    return {
+        "feature_names": list(feature_names),
+        "axes": axes,
+        "values": values.reshape(shape).astype(dtype),
+        "step": float(step),
+    }
+
+
+def lattice_predict(lattice: Dict[str, Any], X: np.ndarray, method: str = "linear") -> np.ndarray:
+    """
+    Vectorized lattice lookup for a batch of rows.
+
+    method="nearest" indexes the closest grid point; method="linear" blends the
+    2^d surrounding grid points (multilinear interpolation). Inputs outside the
+    grid are clamped to its edges.
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    axes = lattice["axes"]
+    values = lattice["values"]
+
+    if method == "nearest":
+        index = []
+        for column, axis in enumerate(axes):
+            i = np.clip(np.searchsorted(axis, X[:, column]), 1, axis.size - 1)
+            # pick whichever neighbour is closer
+            i -= (X[:, column] - axis[i - 1]) < (axis[i] - X[:, column])
+            index.append(i)
+        return values[tuple(index)].astype(np.float64)
+
+    if method != "linear":
+        raise ValueError(f"Unknown lattice method: {method}")
+
+    lower, frac = [], []
+    for column, axis in enumerate(axes):
+        i = np.clip(np.searchsorted(axis, X[:, column], side="right") - 1, 0, axis.size - 2)
+        t = (X[:, column] - axis[i]) / (axis[i + 1] - axis[i])
+        lower.append(i)
+        frac.append(np.clip(t, 0.0, 1.0))
+
+    result = np.zeros(X.shape[0])
+    n_dims = len(axes)
+    for corner in range(2 ** n_dims):
+        weight = np.ones(X.shape[0])
+        index = []
+        for dim in range(n_dims):
+            upper = (corner >> dim) & 1
+            weight *= frac[dim] if upper else 1.0 - frac[dim]
+            index.append(lower[dim] + upper)
+        result += weight * values[tuple(index)]
+    return result
+
+
+def measure_lattice_error(
+    lattice: Dict[str, Any],
+    model,
+    n_samples: int = 20_000,
+    random_state: int = 42,
+) -> Dict[str, float]:
+    """
+    Compare lattice lookups against the forest on random in-range inputs at the
+    app's 0.1-hour precision (the inputs the lattice will actually serve).
+    """
+    rng = np.random.default_rng(random_state)
+    columns = []
+    for name in lattice["feature_names"]:
+        low, high = FEATURE_RANGES[name]
+        if name in INTEGER_FEATURES:
+            columns.append(rng.integers(low, high + 1, n_samples).astype(float))
+        else:
+            columns.append(np.round(rng.uniform(low, high, n_samples), 1))
+    X = np.column_stack(columns)
+
+    expected = model.predict(X)
+    expected_tiers = [categorize_risk(v) for v in expected]
+
+    errors = {}
+    for method in ("nearest", "linear"):
+        predicted = lattice_predict(lattice, X, method=method)
+        abs_error = np.abs(predicted - expected)
+        errors[f"{method}_max_abs_error"] = float(abs_error.max())
+        errors[f"{method}_mean_abs_error"] = float(abs_error.mean())
+        errors[f"{method}_p99_abs_error"] = float(np.percentile(abs_error, 99))
+        errors[f"{method}_tier_agreement"] = float(
+            np.mean([categorize_risk(v) == t for v, t in zip(predicted, expected_tiers)])
+        )
+
+    print("===== Lattice Error vs Forest =====")
+    for key, value in errors.items():
+        print(f"{key:>28}: {value:.4f}")
+    print("===================================")
+    return errors
+
+
+def save_lattice(lattice: Dict[str, Any], errors: Dict[str, float]):
+    """
+    Save the lattice tensor, its axes and measured errors to models/prediction_lattice.npz.
+    """
+    lattice_path = get_models_dir() / LATTICE_FILENAME
+    with atomic_path(lattice_path) as tmp_path:
+        np.savez_compressed(
+            tmp_path,
+            values=lattice["values"],
+            feature_names=np.array(lattice["feature_names"]),
+            step=lattice["step"],
+            error_names=np.array(list(errors.keys())),
+            error_values=np.array(list(errors.values())),
+            **{f"axis_{i}": axis for i, axis in enumerate(lattice["axes"])},
+        )
+    print(f"Saved prediction lattice ({lattice['values'].nbytes / 1e6:.1f} MB "
+          f"{lattice['values'].dtype}) to {lattice_path}")
+
+
+def load_lattice(source=None):
+    """
+    Load models/prediction_lattice.npz (or the open file `source`), or return
+    None if it has not been built.
+    """
+    if source is None:
+        source = get_models_dir() / LATTICE_FILENAME
+        if not source.exists():
+            return None
+    with np.load(source) as data:
+        feature_names = [str(name) for name in data["feature_names"]]
+        return {
+            "feature_names": feature_names,
+            "axes": [data[f"axis_{i}"] for i in range(len(feature_names))],
+            "values": data["values"],
+            "step": float(data["step"]),
+            "errors": dict(zip([str(n) for n in data["error_names"]], data["error_values"].tolist())),
+        }
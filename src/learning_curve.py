@@ -0,0 +1,236 @@
+"""
+Learning curve for the Random Forest: how much training data does it need?
+
+Trains the default forest (train.RF_PARAMS) on stratified subsamples of the
+training split of increasing size, a few at a time in worker processes (each
+one's trees built on its share of the cores), and records
+held-out MAE / R^2 against fit time and model size. The smallest sample whose
+MAE stays within a tolerance of the full-data MAE is recommended, so scheduled
+retrains can downsample without losing accuracy.
+
+Usage:
+    python -m src.learning_curve
+    python -m src.learning_curve --fractions 0.05 0.1 0.25 0.5 1.0 --repeats 3 --tolerance 0.02
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import train_test_split
+
+from .forest import available_cores
+from .utils import RISK_THRESHOLDS, atomic_path, get_models_dir
+
+LEARNING_CURVE_FILENAME = "learning_curve.json"
+
+DEFAULT_FRACTIONS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1.0)
+
+# Every running fit holds a whole forest (about 1 GB at full size), so only a
+# few run at once; the cores are shared out between their trees instead
+DEFAULT_CONCURRENT_FITS = 2
+
+# A fitted sklearn tree stores a 64-byte record per node plus one float64 value
+# per node and output, which is what its pickle holds
+NODE_RECORD_BYTES = 64
+
+
+def tree_bytes(tree) -> int:
+    """Size of a fitted tree's node arrays, from its node count."""
+    return tree.tree_.node_count * (NODE_RECORD_BYTES + 8 * tree.tree_.n_outputs)
+
+
+def stratified_subsample(y: np.ndarray, n_rows: int, seed: int) -> np.ndarray:
+    """Indices of n_rows rows whose risk-tier mix matches the full set."""
+    if n_rows >= len(y):
+        return np.arange(len(y))
+    tiers = np.searchsorted(RISK_THRESHOLDS, y, side="right")
+    rows, _ = train_test_split(np.arange(len(y)), train_size=n_rows, stratify=tiers, random_state=seed)
+    return np.sort(rows)
+
+
+def _fit_subsample(
+    X_train: np.ndarray,
+    y_train: np.ndarray,
+    X_test: np.ndarray,
+    y_test: np.ndarray,
+    n_rows: int,
+    seed: int,
+    rf_params: Dict[str, Any],
+    n_jobs: int,
+) -> Dict[str, Any]:
+    """Fit one forest on a stratified subsample and score it (runs in a worker)."""
+    rows = stratified_subsample(y_train, n_rows, seed)
+    model = RandomForestRegressor(**{**rf_params, "random_state": seed, "n_jobs": n_jobs})
+    start = time.perf_counter()
+    model.fit(X_train[rows], y_train[rows])
+    fit_seconds = time.perf_counter() - start
+
+    y_pred = model.predict(X_test)
+    return {
+        "n_rows": len(rows),
+        "seed": seed,
+        "mae": float(mean_absolute_error(y_test, y_pred)),
+        "r2": float(r2_score(y_test, y_pred)),
+        "fit_seconds": fit_seconds,
+        # Size of the trees' node arrays (their pickled size); nodes drive serving memory
+        "model_bytes": sum(tree_bytes(tree) for tree in model.estimators_),
+        "nodes": int(sum(tree.tree_.node_count for tree in model.estimators_)),
+    }
+
+
+def compute_learning_curve(
+    X_train: np.ndarray,
+    y_train: np.ndarray,
+    X_test: np.ndarray,
+    y_test: np.ndarray,
+    rf_params: Dict[str, Any],
+    fractions=DEFAULT_FRACTIONS,
+    repeats: int = 1,
+    tolerance: float = 0.01,
+    n_jobs: int = DEFAULT_CONCURRENT_FITS,
+) -> Dict[str, Any]:
+    """
+    Held-out accuracy, fit time and size of the forest trained on each fraction
+    of the training rows (averaged over `repeats` subsamples), plus the smallest
+    fraction whose MAE is within `tolerance` (relative) of the full-data MAE.
+    Up to n_jobs forests are fitted at once, so peak memory is about n_jobs
+    full-size forests.
+    """
+    fractions = sorted(set(fractions) | {1.0})
+    sizes = {fraction: max(1, int(round(fraction * len(y_train)))) for fraction in fractions}
+    # A single full-data fit suffices: every repeat would use the same rows
+    jobs = [(fraction, seed) for fraction in fractions for seed in range(1 if fraction == 1.0 else repeats)]
+    # Largest fits first, so the slowest ones do not start last
+    jobs.sort(key=lambda job: -sizes[job[0]])
+
+    n_workers = max(1, min(n_jobs, len(jobs)))
+    cores_per_fit = max(1, available_cores() // n_workers)
+    print(f"Fitting {len(jobs)} forests on {len(fractions)} sample sizes "
+          f"({n_workers} at a time, {cores_per_fit} cores each)...")
+    results = Parallel(n_jobs=n_workers)(
+        delayed(_fit_subsample)(
+            X_train, y_train, X_test, y_test, sizes[fraction], rf_params["random_state"] + seed, rf_params,
+            cores_per_fit,
+        )
+        for fraction, seed in jobs
+    )
+
+    points = []
+    for fraction in fractions:
+        runs = [result for (f, _), result in zip(jobs, results) if f == fraction]
+        maes = np.array([run["mae"] for run in runs])
+        points.append(
+            {
+                "fraction": fraction,
+                "n_rows": runs[0]["n_rows"],
+                "repeats": len(runs),
+                "mae": float(maes.mean()),
+                "mae_std": float(maes.std()),
+                "r2": float(np.mean([run["r2"] for run in runs])),
+                "fit_seconds": float(np.mean([run["fit_seconds"] for run in runs])),
+                "model_bytes": int(np.mean([run["model_bytes"] for run in runs])),
+                "nodes": int(np.mean([run["nodes"] for run in runs])),
+            }
+        )
+
+    full = points[-1]
+    limit = full["mae"] * (1 + tolerance)
+    recommended = next(point for point in points if point["mae"] <= limit)
+    for point in points:
+        point["mae_vs_full"] = point["mae"] / full["mae"] - 1
+
+    return {
+        "rf_params": {k: v for k, v in rf_params.items() if k != "n_jobs"},
+        "train_rows": len(y_train),
+        "test_rows": len(y_test),
+        "tolerance": tolerance,
+        "points": points,
+        "recommended": {
+            "fraction": recommended["fraction"],
+            "n_rows": recommended["n_rows"],
+            "mae": recommended["mae"],
+            "full_mae": full["mae"],
+            "fit_speedup": full["fit_seconds"] / recommended["fit_seconds"],
+            "size_ratio": recommended["model_bytes"] / full["model_bytes"],
+        },
+    }
+
+
+def save_learning_curve(curve: Dict[str, Any]):
+    """
+    Save the learning curve to models/learning_curve.json.
+    """
+    curve_path = get_models_dir() / LEARNING_CURVE_FILENAME
+    with atomic_path(curve_path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(curve, f, indent=2)
+    print(f"Saved learning curve to {curve_path}")
+
+
+def main(argv: Optional[List[str]] = None):
+    from .train import FEATURE_NAMES, RF_PARAMS, load_dataset, split_dataset
+
+    parser = argparse.ArgumentParser(description="Learning curve of the PulseMind Random Forest.")
+    parser.add_argument(
+        "--fractions",
+        type=float,
+        nargs="+",
+        default=list(DEFAULT_FRACTIONS),
+        help="Fractions of the training split to train on (1.0 is always included).",
+    )
+    parser.add_argument("--repeats", type=int, default=1, help="Subsamples (seeds) per fraction.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.01,
+        help="Accepted relative MAE increase over the full-data model for the recommendation.",
+    )
+    parser.add_argument("--n-estimators", type=int, default=RF_PARAMS["n_estimators"])
+    parser.add_argument(
+        "--n-jobs",
+        type=int,
+        default=DEFAULT_CONCURRENT_FITS,
+        help="Forests fitted at once; each holds a full forest in memory.",
+    )
+    args = parser.parse_args(argv)
+
+    if any(not 0 < fraction <= 1 for fraction in args.fractions):
+        parser.error("--fractions must be in (0, 1]")
+
+    print("Loading dataset...")
+    X_train, X_test, y_train, y_test = split_dataset(load_dataset(), FEATURE_NAMES)
+
+    curve = compute_learning_curve(
+        X_train,
+        y_train,
+        X_test,
+        y_test,
+        {**RF_PARAMS, "n_estimators": args.n_estimators},
+        fractions=args.fractions,
+        repeats=args.repeats,
+        tolerance=args.tolerance,
+        n_jobs=args.n_jobs,
+    )
+
+    print("===== Learning Curve =====")
+    print(f"{'fraction':>8} {'rows':>8} {'MAE':>7} {'vs full':>8} {'R^2':>6} {'fit s':>7} {'MB':>8}")
+    for point in curve["points"]:
+        print(f"{point['fraction']:>8.2f} {point['n_rows']:>8} {point['mae']:>7.3f} "
+              f"{point['mae_vs_full']:>+8.1%} {point['r2']:>6.3f} {point['fit_seconds']:>7.1f} "
+              f"{point['model_bytes'] / 1e6:>8.1f}")
+    recommended = curve["recommended"]
+    print(f"Recommended: {recommended['fraction']:.0%} of the training rows ({recommended['n_rows']}), "
+          f"MAE {recommended['mae']:.3f} vs {recommended['full_mae']:.3f}, "
+          f"{recommended['fit_speedup']:.1f}x faster to fit, {recommended['size_ratio']:.0%} of the size")
+    print("==========================")
+
+    save_learning_curve(curve)
+
+
+if __name__ == "__main__":
+    main()
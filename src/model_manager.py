@@ -0,0 +1,398 @@
+"""
+Hot-reloadable model versions.
+
+Training publishes a version by writing models/model_version.json last, once
+every artifact of the run is in place (see publish_model_version). The version
+file lists the SHA-256 of every artifact that belongs to it; artifacts are
+grouped by the trainer that publishes them (`src.train` the forest and what is
+derived from it, `src.train_xgb` the XGBoost model), and publishing one group
+carries the others over.
+
+Publishing also snapshots the version's artifacts into models/versions/<version>/
+as hard links. Artifacts are only ever replaced whole (a new file renamed over
+the old one), so a snapshot keeps its files unchanged while a later training run
+rewrites models/. A ModelVersion reads from its snapshot, loads only the listed
+artifacts and checks each against its hash, so it never mixes in a file from
+another run, and a server starting mid-training still loads the published
+version.
+
+A ModelManager holds the active ModelVersion: everything serving derives from
+one trained model (feature names, importances, the flattened forest, cached
+curves). It can watch the version file from a background thread. A new version
+is loaded and warmed on that thread, then swapped in with a single reference
+assignment. Each request takes one reference to the active version and uses it
+throughout, so in-flight requests finish on the version they started with. The
+old version is freed once the last of them drops its reference.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import joblib
+import numpy as np
+
+from .evaluate import PERMUTATION_IMPORTANCE_FILENAME, load_permutation_importance
+from .explain import PARTIAL_DEPENDENCE_FILENAME, load_partial_dependence
+from .forest import QUANTIZED_FOREST_FILENAME, FlatForest, load_quantized_forest
+from .lattice import LATTICE_FILENAME, load_lattice
+from .surrogate import SURROGATE_FILENAME, load_surrogate
+from .utils import atomic_path, get_models_dir, timestamp
+
+MODEL_VERSION_FILENAME = "model_version.json"
+
+# Published versions are snapshotted under models/versions/; the newest few are kept
+VERSIONS_DIRNAME = "versions"
+KEEP_VERSIONS = 3
+
+
+def version_dir(version: str) -> Path:
+    """The snapshot directory of a published model version."""
+    return get_models_dir() / VERSIONS_DIRNAME / version
+
+
+def _snapshot_version(version: str, groups: Dict[str, Dict[str, str]], group: str, previous: Optional[str]):
+    """
+    Hard-link the artifacts of `version` into version_dir(version) (copying where
+    the filesystem has no hard links). The `group` artifacts come from models/;
+    the carried-over ones from the previous version's snapshot when it has them,
+    since models/ may already hold a newer, unpublished run's files.
+    """
+    previous_dir = version_dir(previous) if previous else None
+    tmp_dir = version_dir(f".{version}.tmp")
+    tmp_dir.mkdir(parents=True)
+    try:
+        for name, source_group in ((name, g) for g, items in groups.items() for name in items):
+            source = get_models_dir() / name
+            if source_group != group and previous_dir is not None and (previous_dir / name).exists():
+                source = previous_dir / name
+            try:
+                os.link(source, tmp_dir / name)
+            except FileNotFoundError:
+                raise FileNotFoundError(f"Cannot publish model version {version}: {source} is missing")
+            except OSError:
+                shutil.copy2(source, tmp_dir / name)
+        os.replace(tmp_dir, version_dir(version))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _prune_versions(keep: int = KEEP_VERSIONS):
+    """
+    Remove all but the newest `keep` version snapshots (version names start
+    with their publish time, so they sort chronologically).
+    """
+    versions_dir = get_models_dir() / VERSIONS_DIRNAME
+    snapshots = sorted(path for path in versions_dir.iterdir() if path.is_dir() and not path.name.startswith("."))
+    for path in snapshots[:-keep]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def publish_model_version(group: str, artifacts: Dict[str, str]) -> str:
+    """
+    Publish a new model version whose `group` artifacts are exactly `artifacts`
+    (file name in models/ -> SHA-256); the other groups' artifacts are carried
+    over from the currently published version. Call this after all of them are
+    written: they are snapshotted into version_dir(version) first, then
+    watching servers load and swap them in.
+    """
+    published = read_published_version()
+    groups = dict((published or {}).get("artifacts") or {})
+    groups[group] = dict(sorted(artifacts.items()))
+
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    _snapshot_version(version, groups, group, published["version"] if published else None)
+    version_path = get_models_dir() / MODEL_VERSION_FILENAME
+    with atomic_path(version_path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(
+            {"version": version, "published_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "artifacts": groups},
+            f,
+            indent=2,
+        )
+    print(f"Published model version {version} (new {group} artifacts) to {version_path}")
+    _prune_versions()
+    return version
+
+
+def read_published_version() -> Optional[Dict[str, Any]]:
+    """
+    The contents of models/model_version.json, or None for artifacts trained
+    before versioning.
+    """
+    version_path = get_models_dir() / MODEL_VERSION_FILENAME
+    if not version_path.exists():
+        return None
+    with open(version_path, "r") as f:
+        return json.load(f)
+
+
+def read_model_version() -> Optional[str]:
+    """
+    The published model version, or None for artifacts trained before versioning.
+    """
+    published = read_published_version()
+    return published["version"] if published else None
+
+
+class ModelVersion:
+    """
+    All serving artifacts of one published model version. The core artifacts are
+    loaded up front; the optional lattice, surrogate and XGBoost backends on first
+    use, and only if the version lists them (see _open_artifact).
+    """
+
+    def __init__(self, version: Optional[str], artifacts: Optional[Dict[str, str]] = None):
+        """
+        `artifacts` maps the version's files to their SHA-256. None (versions
+        published before artifacts were listed, or no version at all) loads
+        whatever is in models/ unchecked. Files are read from the version's
+        snapshot, or from models/ for versions published before snapshots.
+        """
+        self.version = version
+        self.artifacts = artifacts
+        snapshot = version_dir(version) if version is not None and artifacts is not None else None
+        self.artifact_dir = snapshot if snapshot is not None and snapshot.is_dir() else get_models_dir()
+
+        timestamp(f"Loading model version {version or 'unversioned'}")
+        with self._open_artifact("feature_names.json") as f:
+            if f is None:
+                raise FileNotFoundError(f"feature_names.json is not part of model version {version}")
+            self.feature_names = json.load(f)
+
+        model = None
+        with self._open_artifact(QUANTIZED_FOREST_FILENAME) as f:
+            quantized = load_quantized_forest(f) if f is not None else None
+        if quantized is not None:
+            self.forest, forest_features = quantized
+            if forest_features != self.feature_names:
+                raise ValueError(
+                    f"Quantized forest features {forest_features} do not match model features {self.feature_names}"
+                )
+        else:
+            timestamp("No quantized forest; loading and flattening model.pkl...")
+            model = self._load_model()
+            self.forest = FlatForest.from_sklearn(model)
+        timestamp(f"Forest ready ({self.forest.n_trees} trees, {self.forest.nbytes / 1e6:.0f} MB)")
+
+        # Prefer the held-out permutation importance artifact over the forest's
+        # impurity-based importances, which are biased towards high-cardinality features.
+        with self._open_artifact(PERMUTATION_IMPORTANCE_FILENAME) as f:
+            importance = load_permutation_importance(f) if f is not None else None
+        if importance is not None:
+            shares = {item["feature"]: item["share"] for item in importance["features"]}
+            self.importances = np.array([shares.get(name, 0.0) for name in self.feature_names])
+        else:
+            if model is None:
+                model = self._load_model()
+            self.importances = model.feature_importances_
+        # The sklearn model itself is not kept: the forest serves every prediction
+        del model
+
+        with self._open_artifact(PARTIAL_DEPENDENCE_FILENAME) as f:
+            self.partial_dependence = (load_partial_dependence(f) if f is not None else None) or {"curves": {}}
+
+        with self._open_artifact("shap_interactions.json") as f:
+            self.interactions = json.load(f) if f is not None else None
+
+        self._lock = threading.Lock()
+        self._lattice = None
+        self._surrogate = None
+        self._xgboost = None
+
+    @contextmanager
+    def _open_artifact(self, name: str):
+        """
+        Open <artifact_dir>/<name> for reading if it belongs to this version, else
+        yield None. The file is checked against the version's hash and then loaded
+        from the same open file, so what the caller reads is what was checked.
+        """
+        path = self.artifact_dir / name
+        if self.artifacts is None:
+            if not path.exists():
+                yield None
+                return
+            with open(path, "rb") as f:
+                yield f
+            return
+
+        expected = self.artifacts.get(name)
+        if expected is None:
+            yield None
+            return
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            raise FileNotFoundError(f"{name} of model version {self.version} is missing from {path.parent}")
+        with f:
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+            if digest.hexdigest() != expected:
+                raise ValueError(f"{name} in {path.parent} does not match model version {self.version}")
+            f.seek(0)
+            yield f
+
+    def _load_model(self):
+        with self._open_artifact("mental_health_model.pkl") as f:
+            if f is None:
+                raise FileNotFoundError(f"mental_health_model.pkl is not part of model version {self.version}")
+            return joblib.load(f)
+
+    def _check_features(self, name: str, feature_names):
+        if feature_names != self.feature_names:
+            raise ValueError(f"{name} features {feature_names} do not match model features {self.feature_names}")
+
+    def lattice(self) -> Dict[str, Any]:
+        """The precomputed prediction lattice (written by `python -m src.train --lattice`)."""
+        with self._lock:
+            if self._lattice is None:
+                timestamp("Loading prediction lattice...")
+                with self._open_artifact(LATTICE_FILENAME) as f:
+                    lattice = load_lattice(f) if f is not None else None
+                if lattice is None:
+                    raise FileNotFoundError(
+                        f"No prediction lattice in model version {self.version}; "
+                        "run `python -m src.train --lattice` first."
+                    )
+                self._check_features("Lattice", lattice["feature_names"])
+                self._lattice = lattice
+                timestamp(f"Lattice loaded (grid {lattice['values'].shape}, errors {lattice['errors']})")
+            return self._lattice
+
+    def surrogate(self) -> Dict[str, Any]:
+        """The distilled GAM surrogate (written by `python -m src.train --surrogate`)."""
+        with self._lock:
+            if self._surrogate is None:
+                timestamp("Loading GAM surrogate...")
+                with self._open_artifact(SURROGATE_FILENAME) as f:
+                    surrogate = load_surrogate(f) if f is not None else None
+                if surrogate is None:
+                    raise FileNotFoundError(
+                        f"No GAM surrogate in model version {self.version}; "
+                        "run `python -m src.train --surrogate` first."
+                    )
+                self._check_features("Surrogate", surrogate["feature_names"])
+                self._surrogate = surrogate
+                timestamp(f"Surrogate loaded (fidelity {surrogate['fidelity']})")
+            return self._surrogate
+
+    def xgboost(self):
+        """The native XGBoost model (written by `python -m src.train_xgb`)."""
+        with self._lock:
+            if self._xgboost is None:
+                from .xgb_model import load_xgb_model, xgb_model_filenames
+
+                timestamp("Loading XGBoost model...")
+                loaded = None
+                for name in xgb_model_filenames():
+                    with self._open_artifact(name) as f:
+                        if f is not None:
+                            loaded = load_xgb_model(source=f)
+                            break
+                if loaded is None:
+                    raise FileNotFoundError(
+                        f"No XGBoost model in model version {self.version}; run `python -m src.train_xgb` first."
+                    )
+                model, feature_names = loaded
+                self._check_features("XGBoost", feature_names)
+                self._xgboost = model
+                timestamp(f"XGBoost model loaded ({model.get_booster().num_boosted_rounds()} rounds)")
+            return self._xgboost
+
+    def warm(self):
+        """Run one prediction so the first real request pays no first-call costs."""
+        self.forest.predict_with_uncertainty(np.zeros((1, len(self.feature_names))))
+
+
+class ModelManager:
+    """Holds the active ModelVersion and swaps in newly published ones."""
+
+    def __init__(self):
+        self._current: Optional[ModelVersion] = None
+        # Serializes loads; requests never take it once a version is active
+        self._load_lock = threading.Lock()
+        self._failed_version = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def current(self) -> ModelVersion:
+        """The active version, loaded on first use."""
+        current = self._current
+        if current is None:
+            with self._load_lock:
+                if self._current is None:
+                    self._current = self._load_published()
+                current = self._current
+        return current
+
+    def _load_published(self) -> ModelVersion:
+        # If training publishes again while we read the files, what we loaded may
+        # mix two runs: start over until the version is stable across the load.
+        while True:
+            published = read_published_version()
+            version = published["version"] if published else None
+            artifacts = None
+            if published and "artifacts" in published:
+                artifacts = {name: sha256 for group in published["artifacts"].values() for name, sha256 in group.items()}
+            candidate = ModelVersion(version, artifacts)
+            if read_model_version() == version:
+                return candidate
+            timestamp(f"Model version changed while loading {version}; reloading")
+
+    def reload_if_changed(self) -> bool:
+        """
+        Load, warm and swap in the published version if it differs from the
+        active one. A version that fails to load is skipped (the active one keeps
+        serving) until a newer one is published. Returns whether a swap happened.
+        """
+        published = read_model_version()
+        current = self._current
+        if current is not None and published == current.version:
+            return False
+        if published is not None and published == self._failed_version:
+            return False
+
+        with self._load_lock:
+            try:
+                candidate = self._load_published()
+                candidate.warm()
+            except Exception as e:
+                self._failed_version = published
+                print(f"[ERROR] Could not load model version {published}: {e}")
+                return False
+            previous, self._current = self._current, candidate
+
+        timestamp(
+            f"Swapped model version {previous.version if previous else None} -> {candidate.version}"
+        )
+        return True
+
+    def start(self, poll_interval: float = 5.0):
+        """Watch models/ for newly published versions from a daemon thread."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(
+            target=self._watch, args=(poll_interval,), name="model-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self, poll_interval: float):
+        while not self._stop.wait(poll_interval):
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                print(f"[ERROR] Model watcher: {e}")
@@ -1,52 +1,267 @@
 # src/predict.py
 
-import json
-from typing import Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+import threading
 import time
 
-import joblib
 import numpy as np
 
-from .utils import get_models_dir, categorize_risk
+from .explain import compute_ice_curves, default_grids, find_counterfactuals
+from .forest import DEFAULT_QUANTILES
+from .lattice import lattice_predict
+from .model_manager import ModelManager, ModelVersion
+from .shadow import ShadowScorer
+from .surrogate import surrogate_contributions
+from .utils import RISK_CATEGORIES, RISK_THRESHOLDS, SCORE_COMPONENTS, bin_index, categorize_risk, timestamp
 
-# ---- Module-level caches ----
-_MODEL = None
-_FEATURE_NAMES: List[str] = []
+# ---- Active model version ----
+# Every model-derived artifact (feature names, importances, forest, cached
+# curves) lives on one ModelVersion. Each request reads the active version once
+# and uses it throughout, so a hot reload never mixes artifacts of two versions.
+_MANAGER = ModelManager()
 
+# Optional candidate model scored alongside live requests (see enable_shadow)
+_SHADOW: Optional[ShadowScorer] = None
 
-def timestamp(label: str):
-    print(f"[DEBUG] {label} at {time.strftime('%H:%M:%S')}")
+# Serving backends for predict_mental_health ("ensemble" combines the others)
+BACKENDS = ("forest", "lattice", "surrogate", "xgboost", "ensemble")
 
+# Default ensemble members and their weights
+ENSEMBLE_WEIGHTS = {"forest": 0.5, "xgboost": 0.5}
 
-def _load_artifacts_once():
+# Backends whose contributions are exact (base_value + sum == score); the others'
+# are importance-based and cannot be combined with them
+EXACT_CONTRIBUTION_BACKENDS = ("surrogate", "xgboost")
+
+# Backends with a batch scorer (see _score_batch), alone or as ensemble members
+BATCH_BACKENDS = ("forest", "xgboost")
+
+# Runs ensemble members concurrently (see _run_members)
+_MEMBER_POOL: Optional[ThreadPoolExecutor] = None
+_MEMBER_POOL_LOCK = threading.Lock()
+
+# Quantiles of the per-tree predictions reported as uncertainty
+QUANTILES = DEFAULT_QUANTILES
+
+
+def enable_hot_reload(poll_interval: float = 5.0):
+    """
+    Watch models/ for newly published model versions (see
+    src.model_manager.publish_model_version) and swap them in without a
+    restart. In-flight requests finish on the version they started with.
+    """
+    _MANAGER.start(poll_interval)
+
+
+def get_model_version() -> ModelVersion:
+    """The active model version (loaded on first use)."""
+    return _MANAGER.current()
+
+
+def enable_shadow(load_model=None) -> ShadowScorer:
+    """
+    Also score every predict_mental_health request with a candidate model (by
+    default the XGBoost baseline from `python -m src.train_xgb`) on a background
+    thread. Users get the live result without waiting for the candidate;
+    get_shadow_stats() reports how the two compare.
+    """
+    global _SHADOW
+
+    if _SHADOW is None:
+        _SHADOW = ShadowScorer() if load_model is None else ShadowScorer(load_model)
+    return _SHADOW
+
+
+def disable_shadow():
+    """Stop shadow scoring (already queued requests are still scored)."""
+    global _SHADOW
+
+    shadow, _SHADOW = _SHADOW, None
+    if shadow is not None:
+        shadow.close(wait=False)
+
+
+def get_shadow_stats() -> Optional[Dict[str, Any]]:
+    """
+    Live vs shadow comparison so far: latencies, score deltas and risk-tier
+    flips, or None if shadow scoring is not enabled.
+    """
+    shadow = _SHADOW
+    return shadow.stats() if shadow is not None else None
+
+
+def _build_row(active: ModelVersion, user_features: Dict[str, float]) -> np.ndarray:
+    # Ensure all required features are present
+    missing = set(active.feature_names) - set(user_features.keys())
+    if missing:
+        raise ValueError(f"Missing user features: {missing}")
+
+    # Build input row in correct order
+    return np.array([[user_features[name] for name in active.feature_names]], dtype=float)
+
+
+def _format_uncertainty(forest_output: Dict[str, np.ndarray], row: int) -> Dict[str, Any]:
+    """Per-request uncertainty summary from FlatForest.predict_with_uncertainty output."""
+    return {
+        "std": float(forest_output["std"][row]),
+        "quantiles": {
+            f"p{round(q * 100):02d}": float(v) for q, v in zip(QUANTILES, forest_output["quantiles"][row])
+        },
+        "tier_probabilities": {
+            name: float(p) for name, p in zip(RISK_CATEGORIES, forest_output["tier_probabilities"][row])
+        },
+    }
+
+
+def _score_row(active: ModelVersion, backend: str, X: np.ndarray) -> Dict[str, Any]:
     """
-    Load model and feature names once and store them in module-level globals.
+    Score one row with one backend: 'predicted_score', 'raw_contribs' (per
+    feature, in feature order), 'base_value', 'uncertainty' and, for a
+    multi-output forest, 'components' (both forest only).
     """
-    global _MODEL, _FEATURE_NAMES
+    uncertainty = None
+    components = None
+    if backend == "lattice":
+        predicted_score = float(lattice_predict(active.lattice(), X)[0])
+        exact_contribs = None
+    elif backend == "surrogate":
+        surrogate = active.surrogate()
+        exact_contribs = surrogate_contributions(surrogate, X)[0]
+        base_value = float(surrogate["intercept"])
+        predicted_score = float(base_value + exact_contribs.sum())
+    elif backend == "xgboost":
+        from .xgb_model import xgb_contributions
+
+        contribs, bias = xgb_contributions(active.xgboost(), X)
+        exact_contribs = contribs[0]
+        base_value = float(bias[0])
+        predicted_score = float(base_value + exact_contribs.sum())
+    else:
+        # One traversal gives the per-tree outputs for both the score and its spread
+        # (and, for a multi-output forest, the score's components)
+        forest_output = active.forest.predict_with_uncertainty(X)
+        predicted_score = float(forest_output["mean"][0])
+        uncertainty = _format_uncertainty(forest_output, 0)
+        if "components" in forest_output:
+            components = dict(zip(SCORE_COMPONENTS, map(float, forest_output["components"][0])))
+        exact_contribs = None
+
+    if exact_contribs is not None:
+        # ---- Exact additive contributions (surrogate terms or XGBoost TreeSHAP) ----
+        # predicted_score == base_value + sum(raw_contribs)
+        raw_contribs = exact_contribs
+    else:
+        # ---- Simple global-importance-based contributions ----
+        # Feature importances tell us how influential each feature is overall
+        # (permutation importance when available, otherwise impurity-based)
+        importances = active.importances  # shape: (n_features,)
+
+        # We'll create a pseudo-contribution based on importance * (feature value)
+        raw_contribs = importances * X[0]
+
+        # Use the mean prediction as a "baseline" reference if you like,
+        # but for simplicity we'll just expose normalized contributions.
+        base_value = 0.0  # just a neutral reference point
 
-    if _MODEL is not None and _FEATURE_NAMES:
-        return
+    return {
+        "predicted_score": predicted_score,
+        "raw_contribs": raw_contribs,
+        "base_value": base_value,
+        "uncertainty": uncertainty,
+        "components": components,
+    }
 
-    timestamp("Loading model & feature names")
 
-    models_dir = get_models_dir()
-    model_path = models_dir / "mental_health_model.pkl"
-    feature_names_path = models_dir / "feature_names.json"
+def _get_member_pool() -> ThreadPoolExecutor:
+    """Threads that run ensemble members concurrently (separate from the forest's row pool)."""
+    global _MEMBER_POOL
 
-    timestamp("Loading model.pkl...")
-    _MODEL = joblib.load(model_path)
-    timestamp("Model loaded")
+    with _MEMBER_POOL_LOCK:
+        if _MEMBER_POOL is None:
+            _MEMBER_POOL = ThreadPoolExecutor(max_workers=len(BACKENDS), thread_name_prefix="ensemble")
+        return _MEMBER_POOL
 
-    timestamp("Loading feature_names.json...")
-    with open(feature_names_path, "r") as f:
-        _FEATURE_NAMES = json.load(f)
-    timestamp(f"Loaded feature names: {_FEATURE_NAMES}")
+
+def _run_members(weights: Dict[str, float], score_member) -> Dict[str, Any]:
+    """
+    Run score_member(name) for every ensemble member concurrently: all but the
+    first on the member pool, the first on the calling thread. The native
+    predictors release the GIL, so the wall time is that of the slowest member.
+    """
+    members = list(weights)
+    allowed = [name for name in BACKENDS if name != "ensemble"]
+    if not members or any(name not in allowed for name in members):
+        raise ValueError(f"Invalid ensemble members {members}; choose from {allowed}")
+    if sum(weights.values()) <= 0:
+        raise ValueError(f"Ensemble weights must sum to a positive value: {weights}")
+
+    pool = _get_member_pool()
+    futures = {name: pool.submit(score_member, name) for name in members[1:]}
+    results = {members[0]: score_member(members[0])}
+    results.update({name: future.result() for name, future in futures.items()})
+    return results
+
+
+def _score_ensemble(active: ModelVersion, X: np.ndarray, weights: Dict[str, float]) -> Dict[str, Any]:
+    """
+    Weighted average of the members' scores. Contributions and base value are
+    the weighted averages of the members' only if all of them are exact (see
+    EXACT_CONTRIBUTION_BACKENDS), so they still add up to the ensemble score;
+    otherwise both are None. The forest's per-tree uncertainty describes the
+    forest's score, not the ensemble's, so it is only reported per member.
+    """
+    results = _run_members(weights, lambda name: _score_row(active, name, X))
+    total = float(sum(weights.values()))
+    share = {name: weight / total for name, weight in weights.items()}
+
+    raw_contribs = base_value = None
+    if all(name in EXACT_CONTRIBUTION_BACKENDS for name in results):
+        raw_contribs = sum(share[name] * np.asarray(r["raw_contribs"]) for name, r in results.items())
+        base_value = float(sum(share[name] * r["base_value"] for name, r in results.items()))
+    return {
+        "predicted_score": float(sum(share[name] * r["predicted_score"] for name, r in results.items())),
+        "raw_contribs": raw_contribs,
+        "base_value": base_value,
+        "uncertainty": None,
+        "ensemble": {
+            "weights": share,
+            "member_scores": {name: r["predicted_score"] for name, r in results.items()},
+            "member_uncertainty": {
+                name: r["uncertainty"] for name, r in results.items() if r["uncertainty"] is not None
+            },
+        },
+    }
 
 
-def predict_mental_health(user_features: Dict[str, float]) -> Dict[str, Any]:
+def predict_mental_health(
+    user_features: Dict[str, float],
+    backend: str = "forest",
+    weights: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
     """
     Predict mental health score and provide a simple contribution-style breakdown
-    using the model's feature importances instead of SHAP (to avoid hangs).
+    using global feature importances instead of SHAP (to avoid hangs).
+
+    backend:
+      - "forest": evaluate the Random Forest (default); the result also includes
+        'uncertainty' (std, quantiles and risk-tier probabilities across trees)
+      - "lattice": interpolate the precomputed prediction lattice, O(1) per request
+      - "surrogate": additive GAM distilled from the forest; four table lookups,
+        and contributions are the exact per-feature terms of the score
+      - "xgboost": the native XGBoost model from `python -m src.train_xgb`;
+        contributions are exact TreeSHAP values from XGBoost's pred_contribs
+      - "ensemble": weighted average of several backends (`weights`, default
+        ENSEMBLE_WEIGHTS: forest and XGBoost equally), evaluated concurrently;
+        'ensemble' in the result lists the member scores and the forest's
+        uncertainty. 'uncertainty' is None, and 'contributions' is empty with
+        base_value None unless every member's contributions are exact
+        (surrogate / XGBoost)
+
+    The result's 'model_version' names the model version that served it. If the
+    forest was trained with `--multi-output`, the forest backend also returns
+    'components' ({'mood_score': ..., 'stress_level': ...}) from the same
+    traversal; the score is derived from them. Otherwise 'components' is None.
 
     user_features example:
     {
@@ -58,43 +273,46 @@ def predict_mental_health(user_features: Dict[str, float]) -> Dict[str, Any]:
     """
     timestamp("Starting predict_mental_health()")
 
-    _load_artifacts_once()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
 
-    # Ensure all required features are present
-    missing = set(_FEATURE_NAMES) - set(user_features.keys())
-    if missing:
-        raise ValueError(f"Missing user features: {missing}")
+    active = _MANAGER.current()
 
-    # Build input row in correct order
     timestamp("Building input feature vector...")
-    X = np.array([[user_features[name] for name in _FEATURE_NAMES]])
+    X = _build_row(active, user_features)
 
     # Predict score
     timestamp("Predicting score...")
-    predicted_score = float(_MODEL.predict(X)[0])
+    predict_start = time.perf_counter()
+    if backend == "ensemble":
+        scored = _score_ensemble(active, X, weights or ENSEMBLE_WEIGHTS)
+    else:
+        scored = _score_row(active, backend, X)
+    predicted_score = scored["predicted_score"]
+    live_latency_ms = (time.perf_counter() - predict_start) * 1000
+
+    # The candidate model scores the same row in the background, off this path
+    shadow = _SHADOW
+    if shadow is not None:
+        shadow.submit(X, predicted_score, live_latency_ms)
+
     risk_category = categorize_risk(predicted_score)
     timestamp(f"Predicted score: {predicted_score:.3f} | Risk: {risk_category}")
 
-    # ---- Simple global-importance-based contributions ----
-    timestamp("Computing simple contributions from feature importances...")
-
-    # Feature importances tell us how influential each feature is overall
-    importances = _MODEL.feature_importances_  # shape: (n_features,)
-
-    # We'll create a pseudo-contribution based on importance * (feature value)
-    raw_contribs = importances * X[0]
-
-    # Normalize contributions so they are comparable
-    abs_sum = np.sum(np.abs(raw_contribs)) or 1.0  # avoid div-by-zero
-    normalized_contribs = raw_contribs / abs_sum
-
-    # Use the mean prediction as a "baseline" reference if you like,
-    # but for simplicity we'll just expose normalized contributions.
-    base_value = 0.0  # just a neutral reference point
+    raw_contribs = scored["raw_contribs"]
+    base_value = scored["base_value"]
 
     contributions = []
+    if raw_contribs is None:
+        # An ensemble mixing exact and importance-based members has no additive breakdown
+        raw_contribs = normalized_contribs = []
+    else:
+        # Normalize contributions so they are comparable
+        abs_sum = np.sum(np.abs(raw_contribs)) or 1.0  # avoid div-by-zero
+        normalized_contribs = raw_contribs / abs_sum
+
     for name, value, raw, norm in zip(
-        _FEATURE_NAMES, X[0], raw_contribs, normalized_contribs
+        active.feature_names, X[0], raw_contribs, normalized_contribs
     ):
         contributions.append(
             {
@@ -122,7 +340,213 @@ def predict_mental_health(user_features: Dict[str, float]) -> Dict[str, Any]:
         "risk_category": risk_category,
         "base_value": base_value,
         "contributions": contributions_sorted,
+        "uncertainty": scored["uncertainty"],
+        "components": scored.get("components"),
+        "model_version": active.version,
+        "ensemble": scored.get("ensemble"),
+    }
+
+
+def _score_batch(
+    active: ModelVersion, backend: str, X: np.ndarray, n_threads: Optional[int], explain: bool
+) -> Dict[str, np.ndarray]:
+    """Batch scores of one backend, without risk categories (see predict_batch)."""
+    if backend == "xgboost":
+        model = active.xgboost()
+        if not explain:
+            return {"predicted_score": model.predict(X).astype(np.float64)}
+        from .xgb_model import xgb_contributions
+
+        contributions, base_value = xgb_contributions(model, X)
+        return {
+            "predicted_score": base_value + contributions.sum(axis=1),
+            "contributions": contributions,
+            "base_value": base_value,
+        }
+    if backend != "forest":
+        raise ValueError(f"predict_batch supports the {BATCH_BACKENDS + ('ensemble',)} backends, not {backend!r}")
+
+    output = active.forest.predict_with_uncertainty(X, quantiles=QUANTILES, n_threads=n_threads)
+    result = {
+        "predicted_score": output["mean"],
+        "std": output["std"],
+        "quantiles": output["quantiles"],
+        "tier_probabilities": output["tier_probabilities"],
     }
+    if "components" in output:
+        result["components"] = output["components"]
+    return result
+
+
+def predict_batch(
+    X,
+    n_threads: Optional[int] = None,
+    backend: str = "forest",
+    explain: bool = False,
+    weights: Optional[Dict[str, float]] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Score many rows at once. X is an array with columns in feature_names.json
+    order, or a DataFrame with those columns.
+
+    backend="forest" returns arrays over rows: 'predicted_score',
+    'risk_category', 'std', 'quantiles' (n_rows, len(QUANTILES)) and
+    'tier_probabilities' (n_rows, len(RISK_CATEGORIES)), plus 'components'
+    (n_rows, len(SCORE_COMPONENTS)) for a multi-output forest, all from a single
+    traversal per chunk. Large batches are split by rows across a persistent
+    thread pool; small ones run serially (n_threads caps the threads, None = all
+    available cores).
+
+    backend="xgboost" scores with XGBoost's multithreaded native predictor and
+    returns 'predicted_score' and 'risk_category'; with explain=True also
+    'contributions' (n_rows, n_features) and 'base_value' (n_rows,) from its
+    built-in TreeSHAP.
+
+    backend="ensemble" scores the batch with every member in `weights` (default
+    ENSEMBLE_WEIGHTS; members must be batch backends, i.e. forest or xgboost)
+    concurrently and returns the weighted 'predicted_score' and
+    'risk_category' plus 'member_scores' ({member: scores}). explain=True
+    (the weighted 'contributions' and 'base_value') needs members with exact
+    contributions, i.e. XGBoost only.
+    """
+    active = _MANAGER.current()
+    if hasattr(X, "columns"):
+        X = X[active.feature_names].values
+    X = np.asarray(X, dtype=float)
+
+    if backend == "ensemble":
+        weights = weights or ENSEMBLE_WEIGHTS
+        if any(name not in BATCH_BACKENDS for name in weights):
+            raise ValueError(f"predict_batch ensemble members must be among {BATCH_BACKENDS}, got {list(weights)}")
+        if explain and any(name not in EXACT_CONTRIBUTION_BACKENDS for name in weights):
+            raise ValueError(
+                f"explain=True needs ensemble members with exact contributions {EXACT_CONTRIBUTION_BACKENDS}, "
+                f"got {list(weights)}"
+            )
+        results = _run_members(weights, lambda name: _score_batch(active, name, X, n_threads, explain))
+        total = float(sum(weights.values()))
+        result = {
+            "predicted_score": sum(weights[name] / total * r["predicted_score"] for name, r in results.items()),
+            "member_scores": {name: r["predicted_score"] for name, r in results.items()},
+        }
+        if explain:
+            result["contributions"] = sum(weights[name] / total * r["contributions"] for name, r in results.items())
+            result["base_value"] = sum(weights[name] / total * r["base_value"] for name, r in results.items())
+    else:
+        result = _score_batch(active, backend, X, n_threads, explain)
+
+    result["risk_category"] = np.array(RISK_CATEGORIES)[
+        np.searchsorted(RISK_THRESHOLDS, result["predicted_score"], side="right")
+    ]
+    return result
+
+
+def predict_risk_category(user_features: Dict[str, float], z: float = 3.0) -> Dict[str, Any]:
+    """
+    Risk tier only, for callers (e.g. triage routing) that do not need the exact
+    score. Trees are evaluated in a fixed order and evaluation stops once the
+    running mean, with a z-sigma variance bound, can no longer cross a
+    categorize_risk threshold. `predicted_score` is the running mean at exit.
+    """
+    active = _MANAGER.current()
+    X = _build_row(active, user_features)
+    result = active.forest.predict_anytime(X, z=z)
+
+    return {
+        "risk_category": str(result["risk_categories"][0]),
+        "predicted_score": float(result["scores"][0]),
+        "trees_evaluated": int(result["trees_evaluated"][0]),
+        "n_trees": active.forest.n_trees,
+    }
+
+
+def get_interaction_insights(user_features: Dict[str, float], top_k: int = 3) -> List[Dict[str, Any]]:
+    """
+    Look up how pairs of habits interact for this user (e.g. TikTok hours x sleep)
+    from the precomputed SHAP interaction grids. No SHAP computation at request time.
+
+    Each insight's 'interaction' is the part of the score shift that comes from the
+    two features together, beyond their individual effects.
+    """
+    summary = _MANAGER.current().interactions
+    if summary is None:
+        raise FileNotFoundError(
+            "models/shap_interactions.json not found; run `python -m src.train --shap-interactions` first."
+        )
+
+    missing = set(summary["feature_names"]) - set(user_features.keys())
+    if missing:
+        raise ValueError(f"Missing user features: {missing}")
+
+    insights = []
+    for pair in summary["pairs"]:
+        name_i, name_j = pair["features"]
+        edges_i = np.asarray(summary["bin_edges"][name_i])
+        edges_j = np.asarray(summary["bin_edges"][name_j])
+        bin_i = int(bin_index(user_features[name_i], edges_i))
+        bin_j = int(bin_index(user_features[name_j], edges_j))
+
+        value = pair["grid"][bin_i][bin_j]
+        if value is None:
+            value = pair["mean"]
+
+        insights.append(
+            {
+                "features": [name_i, name_j],
+                "interaction": float(value),
+                "global_strength": pair["mean_abs"],
+                "direction": "increases_score" if value > 0 else "decreases_score",
+            }
+        )
+
+    insights.sort(key=lambda d: abs(d["interaction"]), reverse=True)
+    return insights[:top_k]
+
+
+def get_what_if_curves(user_features: Dict[str, float]) -> Dict[str, Dict[str, Any]]:
+    """
+    Partial-dependence and ICE curves for "what happens if I change one habit?".
+
+    Returns, per feature, the grid of values, this user's ICE curve (prediction as
+    that one feature varies, everything else fixed) and, when cached at training
+    time, the population PD curve with its 10th/90th percentile band. The ICE
+    curves for all features come from a single batched predict.
+    """
+    active = _MANAGER.current()
+    feature_names = active.feature_names
+    x = _build_row(active, user_features)[0]
+    population = active.partial_dependence["curves"]
+
+    # Evaluate ICE on the cached PD grids so both curves line up point for point
+    grids = default_grids(feature_names)
+    grids.update({name: np.asarray(curve["grid"]) for name, curve in population.items()})
+
+    ice = compute_ice_curves(active.forest, x, feature_names, grids)
+
+    curves = {}
+    for name in feature_names:
+        curve = {
+            "grid": ice[name]["grid"],
+            "ice": ice[name]["ice"],
+            "current_value": float(user_features[name]),
+        }
+        if name in population:
+            curve["pd"] = population[name]["pd"]
+            curve["ice_p10"] = population[name]["ice_p10"]
+            curve["ice_p90"] = population[name]["ice_p90"]
+        curves[name] = curve
+    return curves
+
+
+def find_habit_changes(user_features: Dict[str, float], top_k: int = 3) -> Dict[str, Any]:
+    """
+    Smallest feasible habit changes predicted to move this user into the next
+    (better) risk tier. See `src.explain.find_counterfactuals` for the search.
+    """
+    active = _MANAGER.current()
+    x = _build_row(active, user_features)[0]
+    current_score = float(active.forest.predict(x.reshape(1, -1))[0])
+    return find_counterfactuals(active.forest, x, active.feature_names, current_score, top_k=top_k)
 
 
 def demo():
@@ -0,0 +1,156 @@
+"""
+Shadow scoring: run a candidate model on live requests without affecting them.
+
+The live path hands each request's feature row to a ShadowScorer, which scores
+it with the candidate on a single background thread and folds the result into
+in-memory statistics: latency of both models, score deltas and risk-tier flips.
+The live request never waits for the shadow model. If the shadow falls behind,
+new rows are dropped (and counted) instead of queueing without bound.
+"""
+
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from .utils import categorize_risk
+
+
+def load_xgb_candidate():
+    """
+    The XGBoost model written by `python -m src.train_xgb`, restricted to one
+    thread so shadow scoring does not compete with the live model for cores.
+    """
+    from .xgb_model import load_xgb_model
+
+    loaded = load_xgb_model(n_jobs=1)
+    if loaded is None:
+        raise FileNotFoundError("XGBoost model not found; run `python -m src.train_xgb` first.")
+    return loaded[0]
+
+
+def _latency_summary(samples) -> Dict[str, float]:
+    if not samples:
+        return {}
+    values = np.asarray(samples)
+    return {
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "max": float(values.max()),
+    }
+
+
+class ShadowScorer:
+    """
+    Scores rows with a candidate model off the critical path and aggregates how
+    it compares with the live model.
+
+    load_model is called once, on the background thread, so loading the
+    candidate does not delay the first live request either.
+    """
+
+    def __init__(
+        self,
+        load_model: Callable[[], Any] = load_xgb_candidate,
+        max_pending: int = 1000,
+        latency_window: int = 10_000,
+    ):
+        self._load_model = load_model
+        self._model = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+
+        self._pending = 0
+        self._submitted = 0
+        self._dropped = 0
+        self._errors = 0
+        self._last_error: Optional[str] = None
+        self._scored = 0
+        self._delta_sum = 0.0
+        self._abs_delta_sum = 0.0
+        self._sq_delta_sum = 0.0
+        self._max_abs_delta = 0.0
+        self._transitions: Counter = Counter()
+        # Latest latencies only, for percentiles over recent traffic
+        self._live_latency_ms = deque(maxlen=latency_window)
+        self._shadow_latency_ms = deque(maxlen=latency_window)
+
+    def submit(self, X: np.ndarray, live_score: float, live_latency_ms: float):
+        """Queue one request for shadow scoring; returns immediately."""
+        with self._lock:
+            self._submitted += 1
+            if self._pending >= self._max_pending:
+                self._dropped += 1
+                return
+            self._pending += 1
+        try:
+            self._executor.submit(self._score, np.array(X, dtype=float), live_score, live_latency_ms)
+        except RuntimeError:
+            # Closed concurrently (shadow scoring was just disabled): never fail the live request
+            with self._lock:
+                self._pending -= 1
+                self._dropped += 1
+
+    def _score(self, X: np.ndarray, live_score: float, live_latency_ms: float):
+        try:
+            if self._model is None:
+                self._model = self._load_model()
+            start = time.perf_counter()
+            shadow_score = float(self._model.predict(X)[0])
+            shadow_latency_ms = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            with self._lock:
+                self._pending -= 1
+                self._errors += 1
+                self._last_error = f"{type(e).__name__}: {e}"
+            return
+
+        delta = shadow_score - live_score
+        with self._lock:
+            self._pending -= 1
+            self._scored += 1
+            self._delta_sum += delta
+            self._abs_delta_sum += abs(delta)
+            self._sq_delta_sum += delta * delta
+            self._max_abs_delta = max(self._max_abs_delta, abs(delta))
+            self._transitions[(categorize_risk(live_score), categorize_risk(shadow_score))] += 1
+            self._live_latency_ms.append(live_latency_ms)
+            self._shadow_latency_ms.append(shadow_latency_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of the aggregated comparison."""
+        with self._lock:
+            n = self._scored
+            flips = {
+                f"{live}->{shadow}": count
+                for (live, shadow), count in sorted(self._transitions.items())
+                if live != shadow
+            }
+            n_flips = sum(flips.values())
+            return {
+                "submitted": self._submitted,
+                "scored": n,
+                "pending": self._pending,
+                "dropped": self._dropped,
+                "errors": self._errors,
+                "last_error": self._last_error,
+                "live_latency_ms": _latency_summary(self._live_latency_ms),
+                "shadow_latency_ms": _latency_summary(self._shadow_latency_ms),
+                "score_delta": {
+                    "mean": self._delta_sum / n,
+                    "mean_abs": self._abs_delta_sum / n,
+                    "rmse": float(np.sqrt(self._sq_delta_sum / n)),
+                    "max_abs": self._max_abs_delta,
+                } if n else {},
+                "tier_flips": n_flips,
+                "tier_flip_rate": n_flips / n if n else 0.0,
+                "tier_transitions": flips,
+            }
+
+    def close(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
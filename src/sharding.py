@@ -0,0 +1,201 @@
+"""
+Sharded Random Forest training across processes or hosts.
+
+RandomForestRegressor(n_jobs=-1) only uses the cores of one process. Here the
+tree budget is split into shards: every shard is an independent sub-forest with
+its own seed, trained by a separate worker process and saved to a shard
+directory. Merging concatenates the sub-forests' estimators into one ordinary
+RandomForestRegressor, the same artifact format as mental_health_model.pkl.
+
+Workers on other hosts share the work through a shared directory:
+
+    # on each host i = 0..N-1
+    python -m src.sharding --shard i --shards N --shard-dir /shared/shards
+    # then on any host: merges the shards and runs the usual post-training stages
+    python -m src.train --shards N --shard-dir /shared/shards
+
+`python -m src.train --shards N` alone trains all N shards as local processes.
+Every shard file records the spec it was trained for (dataset hash, parameters,
+shard count), so shards left over from a different run are retrained, not merged.
+With partition_rows each shard fits only its own disjoint slice of the training
+rows, which divides the per-worker fit time and memory further.
+"""
+
+import argparse
+import copy
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+from .forest import available_cores
+from .utils import atomic_path
+
+
+def shard_filename(shard: int, n_shards: int) -> str:
+    return f"shard-{shard:03d}-of-{n_shards:03d}.pkl"
+
+
+def shard_tree_counts(n_estimators: int, n_shards: int) -> List[int]:
+    """Split the tree budget as evenly as possible, e.g. 200 trees / 3 shards -> [67, 67, 66]."""
+    if not 1 <= n_shards <= n_estimators:
+        raise ValueError(f"Need between 1 and {n_estimators} shards, got {n_shards}")
+    base, extra = divmod(n_estimators, n_shards)
+    return [base + (shard < extra) for shard in range(n_shards)]
+
+
+def make_shard_spec(
+    n_shards: int,
+    rf_params: Dict[str, Any],
+    feature_names: List[str],
+    dataset_sha256: str,
+    partition_rows: bool = False,
+) -> Dict[str, Any]:
+    """Everything a shard's trees depend on; shards only merge if their specs match."""
+    return {
+        "n_shards": n_shards,
+        "params": {k: v for k, v in rf_params.items() if k != "n_jobs"},
+        "feature_names": list(feature_names),
+        "dataset_sha256": dataset_sha256,
+        "partition_rows": partition_rows,
+    }
+
+
+def fit_shard(
+    X_train: np.ndarray,
+    y_train: np.ndarray,
+    shard: int,
+    spec: Dict[str, Any],
+    n_jobs: int = 1,
+) -> RandomForestRegressor:
+    """Fit shard `shard` of the forest described by `spec`."""
+    params = dict(spec["params"])
+    seed = params.pop("random_state")
+    params["n_estimators"] = shard_tree_counts(params["n_estimators"], spec["n_shards"])[shard]
+
+    if spec["partition_rows"]:
+        # Same permutation in every worker, so the slices are disjoint and cover all rows
+        rows = np.array_split(np.random.default_rng(seed).permutation(len(X_train)), spec["n_shards"])[shard]
+        X_train, y_train = X_train[rows], y_train[rows]
+
+    # A distinct seed per shard; shard 0 of a single shard is the unsharded forest
+    model = RandomForestRegressor(**params, random_state=seed + shard, n_jobs=n_jobs)
+    model.fit(X_train, y_train)
+    return model
+
+
+def save_shard(model: RandomForestRegressor, shard: int, spec: Dict[str, Any], shard_dir: Path):
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    with atomic_path(shard_dir / shard_filename(shard, spec["n_shards"])) as tmp_path:
+        joblib.dump({"spec": spec, "shard": shard, "model": model}, tmp_path)
+
+
+def load_shard(shard: int, spec: Dict[str, Any], shard_dir: Path) -> Optional[RandomForestRegressor]:
+    """The saved shard's model, or None if it is missing or was trained for another spec."""
+    path = shard_dir / shard_filename(shard, spec["n_shards"])
+    if not path.exists():
+        return None
+    saved = joblib.load(path)
+    if saved["spec"] != spec or saved["shard"] != shard:
+        return None
+    return saved["model"]
+
+
+def merge_forests(models: List[RandomForestRegressor], **params) -> RandomForestRegressor:
+    """
+    One fitted forest holding the trees of all `models`, in order. `params`
+    (e.g. the unsharded forest's n_jobs and random_state) replace the ones the
+    first shard was fitted with.
+    """
+    n_features = {model.n_features_in_ for model in models}
+    if len(n_features) != 1:
+        raise ValueError(f"Cannot merge forests fitted on different feature counts: {sorted(n_features)}")
+    merged = copy.copy(models[0])
+    merged.estimators_ = [tree for model in models for tree in model.estimators_]
+    merged.set_params(**params, n_estimators=len(merged.estimators_))
+    return merged
+
+
+def run_shard_worker(shard: int, spec: Dict[str, Any], shard_dir: Path, n_jobs: int = 1) -> float:
+    """
+    Load the dataset, fit one shard and save it to shard_dir. Runs in its own
+    process (local pool or a remote host). Returns the fit time in seconds.
+    """
+    from .train import load_dataset, split_dataset  # train imports this module
+
+    X_train, _, y_train, _ = split_dataset(load_dataset(), spec["feature_names"])
+    start = time.perf_counter()
+    model = fit_shard(X_train, y_train, shard, spec, n_jobs=n_jobs)
+    seconds = time.perf_counter() - start
+    save_shard(model, shard, spec, shard_dir)
+    print(f"Shard {shard + 1}/{spec['n_shards']}: {model.n_estimators} trees in {seconds:.1f}s")
+    return seconds
+
+
+def train_sharded_forest(
+    spec: Dict[str, Any], shard_dir: Path, max_workers: Optional[int] = None, n_jobs: int = -1
+):
+    """
+    Train every shard of `spec` that shard_dir does not already hold, one
+    local process per shard (at most max_workers at a time), then merge all
+    shards into one forest with the spec's random_state and `n_jobs`, like an
+    unsharded one.
+    """
+    # Each shard file is unpickled once: reused shards are kept, trained ones loaded after
+    models = {shard: load_shard(shard, spec, shard_dir) for shard in range(spec["n_shards"])}
+    missing = [shard for shard, model in models.items() if model is None]
+    reused = spec["n_shards"] - len(missing)
+    if reused:
+        print(f"Reusing {reused} of {spec['n_shards']} shards from {shard_dir}")
+
+    if missing:
+        n_workers = min(max_workers or len(missing), len(missing))
+        # Share the cores between the workers instead of each one using all of them
+        worker_jobs = max(1, available_cores() // n_workers)
+        print(f"Training {len(missing)} shards in {n_workers} processes ({worker_jobs} cores each)...")
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            list(pool.map(run_shard_worker, missing, [spec] * len(missing), [shard_dir] * len(missing),
+                          [worker_jobs] * len(missing)))
+        for shard in missing:
+            models[shard] = load_shard(shard, spec, shard_dir)
+
+    if any(model is None for model in models.values()):
+        raise RuntimeError(f"Shards missing from {shard_dir} after training")
+    return merge_forests(
+        [models[shard] for shard in range(spec["n_shards"])],
+        random_state=spec["params"]["random_state"],
+        n_jobs=n_jobs,
+    )
+
+
+def main(argv=None):
+    from .build_cache import file_sha256
+    from .train import FEATURE_NAMES, RF_PARAMS
+    from .utils import get_data_path
+
+    parser = argparse.ArgumentParser(description="Train one shard of the PulseMind Random Forest.")
+    parser.add_argument("--shard", type=int, required=True, help="Index of this shard (0-based).")
+    parser.add_argument("--shards", type=int, required=True, help="Total number of shards.")
+    parser.add_argument("--shard-dir", type=Path, required=True, help="Directory shared by all workers.")
+    parser.add_argument(
+        "--partition-rows",
+        action="store_true",
+        help="Fit this shard on its own disjoint slice of the training rows.",
+    )
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Cores for this worker (-1 = all).")
+    args = parser.parse_args(argv)
+
+    if not 0 <= args.shard < args.shards:
+        parser.error(f"--shard must be between 0 and {args.shards - 1}")
+    spec = make_shard_spec(
+        args.shards, RF_PARAMS, FEATURE_NAMES, file_sha256(get_data_path()), partition_rows=args.partition_rows
+    )
+    run_shard_worker(args.shard, spec, args.shard_dir, n_jobs=args.n_jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Additive (GAM-style) surrogate distilled from the Random Forest.
+
+With only four features the forest's behaviour is well summarised by
+
+    score ~= intercept + f_1(x_1) + ... + f_4(x_4) + sum of pairwise g_ij(x_i, x_j)
+
+where every term is stored as a small lookup table over fixed-width bins. The
+terms are fitted by backfitting against the forest's own predictions
+(distillation), so a prediction is four (plus pairwise) table lookups and the
+terms themselves are an exact additive decomposition of the score.
+"""
+
+from itertools import combinations
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sklearn.metrics import mean_absolute_error, r2_score
+
+from .utils import FEATURE_RANGES, INTEGER_FEATURES, atomic_path, categorize_risk, get_models_dir
+
+SURROGATE_FILENAME = "gam_surrogate.npz"
+
+
+def _bin_spec(name: str, bin_width: float):
+    """(low, width, n_bins) of the fixed-width bins for a feature."""
+    low, high = FEATURE_RANGES[name]
+    width = 1.0 if name in INTEGER_FEATURES else bin_width
+    return float(low), float(width), int(round((high - low) / width)) + 1
+
+
+def _bin_index(values: np.ndarray, low: float, width: float, n_bins: int) -> np.ndarray:
+    return np.clip(np.rint((values - low) / width).astype(np.int64), 0, n_bins - 1)
+
+
+def _fill_empty(means: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Interpolate bins with no rows from their nearest populated neighbours."""
+    filled = counts > 0
+    if filled.all() or not filled.any():
+        return np.where(filled, means, 0.0)
+    positions = np.arange(means.size)
+    return np.interp(positions, positions[filled], means[filled])
+
+
+def fit_gam_surrogate(
+    model,
+    X: np.ndarray,
+    feature_names: List[str],
+    bin_width: float = 0.1,
+    pair_bin_width: float = 0.5,
+    pairwise: bool = True,
+    n_iter: int = 10,
+) -> Dict[str, Any]:
+    """
+    Fit per-feature shape functions (and optionally pairwise tables) to the
+    model's predictions on X by backfitting: each term is repeatedly refit to
+    the residual left by all other terms, then centered.
+    """
+    target = model.predict(X)
+    intercept = float(target.mean())
+
+    specs = [_bin_spec(name, bin_width) for name in feature_names]
+    bins = [_bin_index(X[:, j], *spec) for j, spec in enumerate(specs)]
+    terms = [np.zeros(spec[2]) for spec in specs]
+
+    pair_specs, pair_bins, pair_terms = [], [], []
+    if pairwise:
+        for i, j in combinations(range(len(feature_names)), 2):
+            spec_i = _bin_spec(feature_names[i], pair_bin_width)
+            spec_j = _bin_spec(feature_names[j], pair_bin_width)
+            pair_specs.append((i, j, spec_i, spec_j))
+            pair_bins.append(
+                _bin_index(X[:, i], *spec_i) * spec_j[2] + _bin_index(X[:, j], *spec_j)
+            )
+            pair_terms.append(np.zeros(spec_i[2] * spec_j[2]))
+
+    def fitted():
+        total = np.full(X.shape[0], intercept)
+        for term, idx in zip(terms, bins):
+            total += term[idx]
+        for term, idx in zip(pair_terms, pair_bins):
+            total += term[idx]
+        return total
+
+    current = fitted()
+    for iteration in range(n_iter):
+        for j, (term, idx) in enumerate(zip(terms, bins)):
+            partial = target - (current - term[idx])
+            counts = np.bincount(idx, minlength=term.size)
+            sums = np.bincount(idx, weights=partial - intercept, minlength=term.size)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                new_term = _fill_empty(sums / np.maximum(counts, 1), counts)
+            new_term -= np.average(new_term[idx])
+            current += new_term[idx] - term[idx]
+            terms[j] = new_term
+
+        # Pairwise terms only model what the main effects cannot
+        for k, (term, idx) in enumerate(zip(pair_terms, pair_bins)):
+            partial = target - (current - term[idx])
+            counts = np.bincount(idx, minlength=term.size)
+            sums = np.bincount(idx, weights=partial - intercept, minlength=term.size)
+            new_term = np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+            new_term -= np.average(new_term[idx])
+            current += new_term[idx] - term[idx]
+            pair_terms[k] = new_term
+
+        mae = mean_absolute_error(target, current)
+        print(f"  backfitting round {iteration + 1}/{n_iter}: MAE vs forest {mae:.4f}")
+
+    return {
+        "feature_names": list(feature_names),
+        "intercept": intercept,
+        "bins": [(low, width) for low, width, _ in specs],
+        "terms": terms,
+        "pairs": [
+            {
+                "features": (i, j),
+                "bins": ((spec_i[0], spec_i[1]), (spec_j[0], spec_j[1])),
+                "table": term.reshape(spec_i[2], spec_j[2]),
+            }
+            for (i, j, spec_i, spec_j), term in zip(pair_specs, pair_terms)
+        ],
+    }
+
+
+def surrogate_contributions(surrogate: Dict[str, Any], X: np.ndarray) -> np.ndarray:
+    """
+    Per-feature contributions, shape (n_rows, n_features). Each pairwise term is
+    split evenly between its two features, so for every row
+    intercept + contributions.sum() equals the surrogate prediction exactly.
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    contributions = np.empty(X.shape, dtype=float)
+    for j, ((low, width), term) in enumerate(zip(surrogate["bins"], surrogate["terms"])):
+        contributions[:, j] = term[_bin_index(X[:, j], low, width, term.size)]
+
+    for pair in surrogate["pairs"]:
+        i, j = pair["features"]
+        (low_i, width_i), (low_j, width_j) = pair["bins"]
+        table = pair["table"]
+        value = table[
+            _bin_index(X[:, i], low_i, width_i, table.shape[0]),
+            _bin_index(X[:, j], low_j, width_j, table.shape[1]),
+        ]
+        contributions[:, i] += value / 2
+        contributions[:, j] += value / 2
+    return contributions
+
+
+def surrogate_predict(surrogate: Dict[str, Any], X: np.ndarray) -> np.ndarray:
+    """Vectorized surrogate prediction for a batch of rows."""
+    return surrogate["intercept"] + surrogate_contributions(surrogate, X).sum(axis=1)
+
+
+def measure_surrogate_fidelity(
+    surrogate: Dict[str, Any],
+    model,
+    X: np.ndarray,
+    y: Optional[np.ndarray] = None,
+) -> Dict[str, float]:
+    """
+    How closely the surrogate tracks the forest on X (and, if y is given, how
+    both compare against the true scores).
+    """
+    forest = model.predict(X)
+    approx = surrogate_predict(surrogate, X)
+
+    fidelity = {
+        "fidelity_r2": float(r2_score(forest, approx)),
+        "fidelity_mae": float(mean_absolute_error(forest, approx)),
+        "fidelity_max_abs_error": float(np.max(np.abs(forest - approx))),
+        "tier_agreement": float(
+            np.mean([categorize_risk(a) == categorize_risk(b) for a, b in zip(approx, forest)])
+        ),
+    }
+    if y is not None:
+        fidelity["surrogate_mae"] = float(mean_absolute_error(y, approx))
+        fidelity["forest_mae"] = float(mean_absolute_error(y, forest))
+
+    print("===== GAM Surrogate Fidelity =====")
+    for key, value in fidelity.items():
+        print(f"{key:>24}: {value:.4f}")
+    print("==================================")
+    return fidelity
+
+
+def save_surrogate(surrogate: Dict[str, Any], fidelity: Dict[str, float]):
+    """
+    Save the surrogate's lookup tables and fidelity report to models/gam_surrogate.npz.
+    """
+    surrogate_path = get_models_dir() / SURROGATE_FILENAME
+    arrays = {
+        "feature_names": np.array(surrogate["feature_names"]),
+        "intercept": surrogate["intercept"],
+        "bins": np.array(surrogate["bins"]),
+        "pair_features": np.array([p["features"] for p in surrogate["pairs"]], dtype=int).reshape(-1, 2),
+        "pair_bins": np.array([p["bins"] for p in surrogate["pairs"]]).reshape(-1, 2, 2),
+        "fidelity_names": np.array(list(fidelity.keys())),
+        "fidelity_values": np.array(list(fidelity.values())),
+    }
+    for j, term in enumerate(surrogate["terms"]):
+        arrays[f"term_{j}"] = term.astype(np.float32)
+    for k, pair in enumerate(surrogate["pairs"]):
+        arrays[f"pair_table_{k}"] = pair["table"].astype(np.float32)
+
+    with atomic_path(surrogate_path) as tmp_path:
+        np.savez_compressed(tmp_path, **arrays)
+    print(f"Saved GAM surrogate to {surrogate_path}")
+
+
+def load_surrogate(source=None):
+    """
+    Load models/gam_surrogate.npz (or the open file `source`), or return None if
+    it has not been distilled.
+    """
+    if source is None:
+        source = get_models_dir() / SURROGATE_FILENAME
+        if not source.exists():
+            return None
+    with np.load(source) as data:
+        feature_names = [str(name) for name in data["feature_names"]]
+        return {
+            "feature_names": feature_names,
+            "intercept": float(data["intercept"]),
+            "bins": [tuple(b) for b in data["bins"].tolist()],
+            "terms": [data[f"term_{j}"].astype(np.float64) for j in range(len(feature_names))],
+            "pairs": [
+                {
+                    "features": tuple(features),
+                    "bins": tuple(tuple(b) for b in bins),
+                    "table": data[f"pair_table_{k}"].astype(np.float64),
+                }
+                for k, (features, bins) in enumerate(
+                    zip(data["pair_features"].tolist(), data["pair_bins"].tolist())
+                )
+            ],
+            "fidelity": dict(
+                zip([str(n) for n in data["fidelity_names"]], data["fidelity_values"].tolist())
+            ),
+        }
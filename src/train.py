@@ -1,7 +1,10 @@
+import argparse
 import json
+import tempfile
 from pathlib import Path
 
 import joblib
+from joblib import Parallel, delayed
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
@@ -9,8 +12,36 @@ from sklearn.metrics import mean_absolute_error, r2_score
 from sklearn.model_selection import train_test_split
 import shap  # make sure 'shap' is installed
 
+from .budget import save_budget_report, train_model_with_budget
+from .build_cache import (
+    file_sha256,
+    library_versions,
+    load_manifest,
+    run_stage,
+    save_manifest,
+    source_fingerprint,
+)
+from .cross_validation import cross_validate, print_cv_report, save_cv_report
+from .evaluate import (
+    bootstrap_evaluation,
+    compute_permutation_importance,
+    print_bootstrap_evaluation,
+    save_evaluation,
+    save_permutation_importance,
+)
+from .explain import compute_partial_dependence, save_partial_dependence
+from .forest import QUANTIZED_FOREST_FILENAME, FlatForest, QuantizedForest, save_quantized_forest
+from .lattice import build_lattice, measure_lattice_error, save_lattice
+from .model_manager import publish_model_version
+from .sharding import make_shard_spec, train_sharded_forest
+from .surrogate import fit_gam_surrogate, measure_surrogate_fidelity, save_surrogate
 from .utils import (
+    SCORE_COMPONENT_WEIGHTS,
+    SCORE_COMPONENTS,
+    atomic_path,
+    bin_index,
     get_data_path,
+    get_project_root,
     get_models_dir,
     compute_mental_health_score,
 )
@@ -51,37 +82,62 @@ def load_dataset() -> pd.DataFrame:
     return df
 
 
-def train_model(df: pd.DataFrame):
+# Feature set: we exclude mood_score and stress_level (both are part of the target definition).
+# The model predicts mental_health_score = mood_score - stress_level from observable digital habits.
+FEATURE_NAMES = [
+    "screen_time_hours",
+    "social_media_platforms_used",
+    "hours_on_TikTok",
+    "sleep_hours",
+]
+
+
+# Random Forest hyperparameters (also part of the build-cache key, see src/build_cache.py)
+RF_PARAMS = {
+    "n_estimators": 200,
+    "random_state": 42,
+    "n_jobs": -1,
+}
+
+
+def split_dataset(df: pd.DataFrame, feature_names=FEATURE_NAMES, target="mental_health_score"):
+    """
+    Deterministic 80/20 train/test split used by train_model and by the
+    post-training stages that evaluate on the same held-out rows. A list of
+    targets (e.g. SCORE_COMPONENTS) gives 2-D y with the same row split.
+    """
+    X = df[feature_names].values
+    y = df[target].values
+
+    return train_test_split(X, y, test_size=0.2, random_state=42)
+
+
+def train_model(df: pd.DataFrame, multi_output: bool = False):
     """
     Train a RandomForestRegressor to predict mental_health_score from
     a set of interpretable features.
-    """
-    # Feature set: we exclude mood_score and stress_level (both are part of the target definition).
-    # The model predicts mental_health_score = mood_score - stress_level from observable digital habits.
-    feature_names = [
-        "screen_time_hours",
-        "social_media_platforms_used",
-        "hours_on_TikTok",
-        "sleep_hours",
-    ]
 
-    X = df[feature_names].values
-    y = df["mental_health_score"].values
+    With multi_output, a single forest predicts the score's components
+    (SCORE_COMPONENTS: mood_score and stress_level) instead, and the score is
+    derived from them; see score_model.
+    """
+    feature_names = list(FEATURE_NAMES)
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
+    target = SCORE_COMPONENTS if multi_output else "mental_health_score"
+    X_train, X_test, y_train, y_test = split_dataset(df, feature_names, target)
 
-    model = RandomForestRegressor(
-        n_estimators=200,
-        random_state=42,
-        n_jobs=-1,
-    )
+    model = RandomForestRegressor(**RF_PARAMS)
 
     model.fit(X_train, y_train)
 
     # Basic evaluation
     y_pred = model.predict(X_test)
+    if multi_output:
+        for i, name in enumerate(SCORE_COMPONENTS):
+            print(f"{name} MAE: {mean_absolute_error(y_test[:, i], y_pred[:, i]):.3f}")
+        # The score is linear in its components, so the forest's score is derived exactly
+        y_test = compute_mental_health_score(y_test[:, 0], y_test[:, 1])
+        y_pred = compute_mental_health_score(y_pred[:, 0], y_pred[:, 1])
     mae = mean_absolute_error(y_test, y_pred)
     r2 = r2_score(y_test, y_pred)
 
@@ -90,16 +146,95 @@ def train_model(df: pd.DataFrame):
     print(f"R^2: {r2:.3f}")
     print("============================")
 
-    # Train a SHAP TreeExplainer for per-prediction feature contributions
+    explainer = fit_explainer(model, X_train, feature_names)
+
+    return model, explainer, feature_names
+
+
+def score_model(model):
+    """
+    Model whose predict() returns mental_health_score: the model itself, or for
+    a multi-output (mood, stress) forest its FlatForest, whose leaf values are
+    the derived score.
+    """
+    if model.n_outputs_ > 1:
+        return FlatForest.from_sklearn(model)
+    return model
+
+
+def fit_predict_forest(X_train, y_train, X_val, y_val, n_jobs: int):
+    """One cross-validation fold of the default forest (see src/cross_validation.py)."""
+    model = RandomForestRegressor(**{**RF_PARAMS, "n_jobs": n_jobs})
+    model.fit(X_train, y_train)
+    return model.predict(X_val), {}
+
+
+def train_model_budgeted(df: pd.DataFrame, max_bytes=None, max_latency_ms=None):
+    """
+    Train the smallest-footprint forest that meets the artifact-size and
+    single-row-latency budgets (see src/budget.py), with the same outputs as train_model.
+    """
+    feature_names = list(FEATURE_NAMES)
+
+    X_train, X_test, y_train, y_test = split_dataset(df, feature_names)
+
+    model, report = train_model_with_budget(
+        X_train,
+        y_train,
+        X_test,
+        y_test,
+        max_bytes=max_bytes,
+        max_latency_ms=max_latency_ms,
+    )
+    save_budget_report(report)
+
+    explainer = fit_explainer(model, X_train, feature_names)
+
+    return model, explainer, feature_names
+
+
+def train_model_sharded(df: pd.DataFrame, n_shards: int, shard_dir=None, partition_rows: bool = False):
+    """
+    Train the forest as n_shards sub-forests in separate processes and merge
+    them (see src/sharding.py), with the same outputs as train_model. Shards
+    already present in shard_dir, e.g. trained on other hosts, are reused.
+    """
+    feature_names = list(FEATURE_NAMES)
+
+    X_train, X_test, y_train, y_test = split_dataset(df, feature_names)
+
+    spec = make_shard_spec(
+        n_shards, RF_PARAMS, feature_names, file_sha256(get_data_path()), partition_rows=partition_rows
+    )
+    if shard_dir is None:
+        with tempfile.TemporaryDirectory(prefix="pulsemind-shards-") as tmp_dir:
+            model = train_sharded_forest(spec, Path(tmp_dir), n_jobs=RF_PARAMS["n_jobs"])
+    else:
+        model = train_sharded_forest(spec, Path(shard_dir), n_jobs=RF_PARAMS["n_jobs"])
+
+    y_pred = model.predict(X_test)
+    print("===== Model Evaluation =====")
+    print(f"Trees: {model.n_estimators} from {n_shards} shards")
+    print(f"MAE: {mean_absolute_error(y_test, y_pred):.3f}")
+    print(f"R^2: {r2_score(y_test, y_pred):.3f}")
+    print("============================")
+
+    explainer = fit_explainer(model, X_train, feature_names)
+
+    return model, explainer, feature_names
+
+
+def fit_explainer(model, X_train: np.ndarray, feature_names):
+    """
+    Train a SHAP TreeExplainer for per-prediction feature contributions.
+    """
     # You can reduce background size if you want smaller artifacts.
     print("Fitting SHAP TreeExplainer (this may take a bit)...")
     # Use a subset as background to keep it lightweight
     background_size = min(2000, X_train.shape[0])
     background = shap.sample(pd.DataFrame(X_train, columns=feature_names),
                              background_size, random_state=42)
-    explainer = shap.TreeExplainer(model, data=background)
-
-    return model, explainer, feature_names
+    return shap.TreeExplainer(model, data=background)
 
 
 def save_artifacts(model, explainer, feature_names):
@@ -112,10 +247,13 @@ def save_artifacts(model, explainer, feature_names):
     explainer_path = models_dir / "mental_health_shap_explainer.pkl"
     feature_names_path = models_dir / "feature_names.json"
 
-    joblib.dump(model, model_path)
-    joblib.dump(explainer, explainer_path)
-
-    with open(feature_names_path, "w") as f:
+    # Each file is swapped in whole, so a running server never reads a partial
+    # pickle; src.model_manager only picks the set up once the version is published.
+    with atomic_path(model_path) as tmp_path:
+        joblib.dump(model, tmp_path)
+    with atomic_path(explainer_path) as tmp_path:
+        joblib.dump(explainer, tmp_path)
+    with atomic_path(feature_names_path) as tmp_path, open(tmp_path, "w") as f:
         json.dump(feature_names, f, indent=2)
 
     print(f"Saved model to       {model_path}")
@@ -123,18 +261,534 @@ def save_artifacts(model, explainer, feature_names):
     print(f"Saved feature names to {feature_names_path}")
 
 
-def main():
+# ---- SHAP interaction stage ----
+# Interaction values cost O(features^2) more than plain SHAP values, so we compute
+# them once at training time over a sample of the dataset and persist only the
+# aggregated matrices and per-bin curves. Serving reads them with a lookup.
+_WORKER_INTERACTION_EXPLAINER = (None, None)
+
+
+def _interaction_chunk(explainer_path: str, X_chunk: np.ndarray) -> np.ndarray:
+    """
+    Compute SHAP interaction values for one chunk of rows inside a worker.
+
+    Each worker memory-maps the dumped explainer once and reuses it for every
+    chunk it receives, so the workers share its node arrays through the OS
+    page cache instead of each holding a copy.
+    """
+    global _WORKER_INTERACTION_EXPLAINER
+    path, explainer = _WORKER_INTERACTION_EXPLAINER
+    if path != explainer_path:
+        explainer = joblib.load(explainer_path, mmap_mode="r")
+        _WORKER_INTERACTION_EXPLAINER = (explainer_path, explainer)
+    values = np.asarray(explainer.shap_interaction_values(X_chunk))
+    if values.ndim == 4:
+        # Multi-output forest: (rows, features, features, outputs); SHAP values
+        # are linear in the output, so the score's are the weighted sum
+        values = values @ np.asarray(SCORE_COMPONENT_WEIGHTS)
+    return values
+
+
+def _bin_edges(values: np.ndarray, n_bins: int) -> np.ndarray:
+    """Quantile bin edges, collapsed to unique values for discrete features."""
+    edges = np.unique(np.quantile(values, np.linspace(0.0, 1.0, n_bins + 1)))
+    if edges.size < 2:
+        edges = np.array([edges[0], edges[0]])
+    return edges
+
+
+def compute_shap_interactions(
+    model,
+    X: np.ndarray,
+    feature_names,
+    n_bins: int = 8,
+    chunk_size: int = 32,
+    n_jobs: int = -1,
+) -> dict:
+    """
+    Compute SHAP interaction values for the rows of X in parallel chunks and
+    aggregate them into:
+      - 'mean_abs' / 'mean': features x features interaction matrices
+        (diagonal = main effects, off-diagonal = pairwise effects)
+      - 'pairs': for every feature pair, a grid of the mean pairwise effect
+        (phi_ij + phi_ji) per (bin of feature i, bin of feature j); each row is
+        the interaction curve over feature j for one bin of feature i.
+    """
+    chunks = [X[i:i + chunk_size] for i in range(0, X.shape[0], chunk_size)]
+    print(f"Computing SHAP interaction values for {X.shape[0]} rows "
+          f"in {len(chunks)} chunks (n_jobs={n_jobs})...")
+    # Interaction values need the path-dependent explainer (no background data).
+    # shap's C extension holds the GIL, so the chunks run in worker processes;
+    # they memory-map one dump of the explainer rather than each loading the model.
+    explainer = shap.TreeExplainer(model)
+    explainer.model.original_model = None  # the sklearn forest itself is not needed
+    with tempfile.TemporaryDirectory(prefix="pulsemind-shap-") as tmp_dir:
+        explainer_path = str(Path(tmp_dir) / "interaction_explainer.joblib")
+        joblib.dump(explainer, explainer_path)
+        del explainer
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_interaction_chunk)(explainer_path, chunk) for chunk in chunks
+        )
+    interactions = np.concatenate(results, axis=0)  # (n_rows, n_features, n_features)
+
+    n_features = len(feature_names)
+    edges = {name: _bin_edges(X[:, i], n_bins) for i, name in enumerate(feature_names)}
+    bins = {name: bin_index(X[:, i], edges[name]) for i, name in enumerate(feature_names)}
+
+    pairs = []
+    for i in range(n_features):
+        for j in range(i + 1, n_features):
+            name_i, name_j = feature_names[i], feature_names[j]
+            pair_effect = interactions[:, i, j] + interactions[:, j, i]
+            n_i, n_j = edges[name_i].size - 1, edges[name_j].size - 1
+
+            flat = bins[name_i] * n_j + bins[name_j]
+            sums = np.bincount(flat, weights=pair_effect, minlength=n_i * n_j)
+            counts = np.bincount(flat, minlength=n_i * n_j)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = (sums / counts).reshape(n_i, n_j)
+
+            pairs.append(
+                {
+                    "features": [name_i, name_j],
+                    "mean_abs": float(np.mean(np.abs(pair_effect))),
+                    "mean": float(np.mean(pair_effect)),
+                    # Empty bins are stored as null and fall back to the pair mean at lookup
+                    "grid": [[None if np.isnan(v) else float(v) for v in row] for row in means],
+                    "counts": counts.reshape(n_i, n_j).tolist(),
+                }
+            )
+
+    return {
+        "feature_names": list(feature_names),
+        "n_samples": int(X.shape[0]),
+        "mean_abs": np.mean(np.abs(interactions), axis=0).tolist(),
+        "mean": np.mean(interactions, axis=0).tolist(),
+        "bin_edges": {name: e.tolist() for name, e in edges.items()},
+        "pairs": sorted(pairs, key=lambda p: p["mean_abs"], reverse=True),
+    }
+
+
+def save_shap_interactions(summary: dict):
+    """
+    Save aggregated SHAP interactions to models/shap_interactions.json.
+    """
+    interactions_path = get_models_dir() / "shap_interactions.json"
+    with atomic_path(interactions_path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Saved SHAP interactions to {interactions_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Train the PulseMind Random Forest and save its artifacts."
+    )
+    parser.add_argument(
+        "--max-model-mb",
+        type=float,
+        default=None,
+        help="Budget mode: maximum model artifact size in MB.",
+    )
+    parser.add_argument(
+        "--max-latency-ms",
+        type=float,
+        default=None,
+        help="Budget mode: maximum single-row serving latency in milliseconds.",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="Train the forest as this many sub-forests in separate processes and merge them.",
+    )
+    parser.add_argument(
+        "--shard-dir",
+        type=Path,
+        default=None,
+        help="Directory for the shards; shards already there (e.g. from `python -m src.sharding`"
+        " on other hosts) are merged instead of retrained.",
+    )
+    parser.add_argument(
+        "--partition-rows",
+        action="store_true",
+        help="With --shards: fit every shard on its own disjoint slice of the training rows.",
+    )
+    parser.add_argument(
+        "--multi-output",
+        action="store_true",
+        help="Fit one forest on (mood_score, stress_level) and derive the score from its outputs.",
+    )
+    parser.add_argument(
+        "--cv",
+        type=int,
+        default=None,
+        metavar="K",
+        help="Cross-validate the forest with K folds on the training split, folds in parallel.",
+    )
+    parser.add_argument(
+        "--no-refit",
+        action="store_true",
+        help="With --cv: stop after cross-validation instead of training the final model.",
+    )
+    parser.add_argument(
+        "--shap-interactions",
+        action="store_true",
+        help="Also precompute aggregated SHAP interaction values (slow; runs in parallel chunks).",
+    )
+    parser.add_argument(
+        "--interaction-samples",
+        type=int,
+        default=500,
+        help="Number of dataset rows to sample for SHAP interaction values.",
+    )
+    parser.add_argument(
+        "--skip-permutation-importance",
+        action="store_true",
+        help="Skip the permutation-importance stage on the held-out split.",
+    )
+    parser.add_argument(
+        "--permutation-repeats",
+        type=int,
+        default=10,
+        help="Number of shuffles per feature for permutation importance.",
+    )
+    parser.add_argument(
+        "--skip-evaluation",
+        action="store_true",
+        help="Skip the bootstrap confidence intervals and per-risk-tier errors on the held-out split.",
+    )
+    parser.add_argument(
+        "--bootstrap-resamples",
+        type=int,
+        default=1000,
+        help="Number of bootstrap resamples for the evaluation stage.",
+    )
+    parser.add_argument(
+        "--skip-partial-dependence",
+        action="store_true",
+        help="Skip caching population partial-dependence curves.",
+    )
+    parser.add_argument(
+        "--pd-samples",
+        type=int,
+        default=500,
+        help="Background rows used for the cached partial-dependence curves.",
+    )
+    parser.add_argument(
+        "--lattice",
+        action="store_true",
+        help="Also evaluate the forest over a dense 4-D grid for O(1) serving.",
+    )
+    parser.add_argument(
+        "--lattice-step",
+        type=float,
+        default=0.25,
+        help="Grid step in hours for the prediction lattice (0.1 = exact for app slider inputs).",
+    )
+    parser.add_argument(
+        "--lattice-dtype",
+        choices=["float32", "float16"],
+        default="float32",
+        help="Storage dtype of the prediction lattice.",
+    )
+    parser.add_argument(
+        "--surrogate",
+        action="store_true",
+        help="Also distill the forest into an additive GAM surrogate of lookup tables.",
+    )
+    parser.add_argument(
+        "--no-surrogate-pairs",
+        action="store_true",
+        help="Fit only per-feature shape functions (no pairwise terms) in the surrogate.",
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Also save the forest with integer thresholds for compact serving.",
+    )
+    parser.add_argument(
+        "--quantize-values",
+        choices=["float32", "float16"],
+        default="float32",
+        help="Storage dtype of the quantized forest's leaf values.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Rebuild every stage even if models/manifest.json shows its artifacts are up to date.",
+    )
+    parser.add_argument(
+        "--n-jobs",
+        type=int,
+        default=-1,
+        help="Worker processes for the parallel post-training stages (-1 = all cores).",
+    )
+    args = parser.parse_args(argv)
+
     print("Loading dataset...")
     df = load_dataset()
+    feature_names = list(FEATURE_NAMES)
+    X_train, X_test, y_train, y_test = split_dataset(df, feature_names)
 
-    print("Training model...")
-    model, explainer, feature_names = train_model(df)
+    manifest = load_manifest()
+    use_cache = not args.no_cache
+    budget_mode = args.max_model_mb is not None or args.max_latency_ms is not None
+    if budget_mode and args.shards is not None:
+        parser.error("--shards cannot be combined with the budget mode flags")
+    if args.shards is None and (args.shard_dir is not None or args.partition_rows):
+        parser.error("--shard-dir and --partition-rows require --shards")
+    if args.multi_output and (budget_mode or args.shards is not None or args.cv is not None):
+        parser.error("--multi-output cannot be combined with budget mode, --shards or --cv")
+    if args.no_refit and args.cv is None:
+        parser.error("--no-refit requires --cv")
 
-    print("Saving artifacts...")
-    save_artifacts(model, explainer, feature_names)
+    # ---- Cross-validation ----
+    if args.cv is not None:
+        # Folds come from the training split only; the test split stays held out
+        def build_cross_validation():
+            report = cross_validate(fit_predict_forest, X_train, y_train, n_splits=args.cv, n_jobs=args.n_jobs)
+            print_cv_report(report, "Random Forest")
+            params = {k: v for k, v in RF_PARAMS.items() if k != "n_jobs"}
+            save_cv_report(report, "cv_report.json", {"params": params})
 
-    print("Done.")
+        run_stage(
+            manifest,
+            "cross_validation",
+            {
+                "dataset_sha256": file_sha256(get_data_path()),
+                "feature_names": feature_names,
+                "params": {k: v for k, v in RF_PARAMS.items() if k != "n_jobs"},
+                "folds": args.cv,
+                "source": source_fingerprint(["train", "cross_validation"]),
+                "libraries": library_versions(),
+            },
+            ["cv_report.json"],
+            build_cross_validation,
+            use_cache,
+        )
+        if args.no_refit:
+            print("Done (cross-validation only).")
+            return
+
+    # ---- Model + explainer ----
+    if budget_mode:
+        params = {"budget": {"max_model_mb": args.max_model_mb, "max_latency_ms": args.max_latency_ms}}
+    else:
+        params = {"random_forest": {k: v for k, v in RF_PARAMS.items() if k != "n_jobs"}}
+        if args.shards is not None:
+            params["sharding"] = {"shards": args.shards, "partition_rows": args.partition_rows}
+        if args.multi_output:
+            params["targets"] = SCORE_COMPONENTS
+    model_inputs = {
+        "dataset_sha256": file_sha256(get_data_path()),
+        "feature_names": feature_names,
+        "params": params,
+        "source": source_fingerprint(["train", "budget", "utils"] + (["sharding"] if args.shards else [])),
+        "libraries": library_versions(),
+    }
+    model_artifacts = ["mental_health_model.pkl", "mental_health_shap_explainer.pkl", "feature_names.json"]
+    if budget_mode:
+        model_artifacts.append("budget_report.json")
+
+    model = None
+
+    def build_model():
+        nonlocal model
+        if budget_mode:
+            print("Training model within size / latency budget...")
+            model, explainer, _ = train_model_budgeted(
+                df,
+                max_bytes=args.max_model_mb * 1e6 if args.max_model_mb is not None else None,
+                max_latency_ms=args.max_latency_ms,
+            )
+        elif args.shards is not None:
+            print(f"Training model in {args.shards} shards...")
+            model, explainer, _ = train_model_sharded(
+                df, args.shards, shard_dir=args.shard_dir, partition_rows=args.partition_rows
+            )
+        elif args.multi_output:
+            print(f"Training multi-output model on {SCORE_COMPONENTS}...")
+            model, explainer, _ = train_model(df, multi_output=True)
+        else:
+            print("Training model...")
+            model, explainer, _ = train_model(df)
+
+        print("Saving artifacts...")
+        save_artifacts(model, explainer, feature_names)
+
+    model_key, rebuilt = run_stage(manifest, "model", model_inputs, model_artifacts, build_model, use_cache)
+    manifest["lineage"] = {
+        "dataset": {"path": str(get_data_path().relative_to(get_project_root())), "rows": len(df)},
+        **model_inputs,
+    }
+
+    def get_fitted_model():
+        # Stages downstream of a cached model load it only if they need rebuilding
+        nonlocal model
+        if model is None:
+            print("Loading cached model...")
+            model = joblib.load(get_models_dir() / "mental_health_model.pkl")
+        return model
+
+    scorer = None
+
+    def get_model():
+        # What the score-based stages evaluate (see score_model)
+        nonlocal scorer
+        if scorer is None:
+            scorer = score_model(get_fitted_model())
+        return scorer
 
+    def downstream(modules, **stage_params):
+        return {"model_key": model_key, "source": source_fingerprint(modules), **stage_params}
+
+    # ---- Post-training stages ----
+    if not args.skip_permutation_importance:
+        def build_permutation_importance():
+            importance = compute_permutation_importance(
+                get_model(),
+                X_test,
+                y_test,
+                feature_names,
+                n_repeats=args.permutation_repeats,
+                n_jobs=args.n_jobs,
+            )
+            save_permutation_importance(importance)
+
+        rebuilt |= run_stage(
+            manifest,
+            "permutation_importance",
+            downstream(["evaluate"], n_repeats=args.permutation_repeats),
+            ["permutation_importance.json"],
+            build_permutation_importance,
+            use_cache,
+        )[1]
+
+    if not args.skip_evaluation:
+        def build_evaluation():
+            evaluation = bootstrap_evaluation(
+                y_test,
+                {"random_forest": get_model().predict(X_test)},
+                n_resamples=args.bootstrap_resamples,
+                n_jobs=args.n_jobs,
+            )
+            print_bootstrap_evaluation(evaluation)
+            save_evaluation(evaluation)
+
+        rebuilt |= run_stage(
+            manifest,
+            "evaluation",
+            downstream(["evaluate"], resamples=args.bootstrap_resamples),
+            ["evaluation.json"],
+            build_evaluation,
+            use_cache,
+        )[1]
+
+    if not args.skip_partial_dependence:
+        def build_partial_dependence():
+            rng = np.random.default_rng(42)
+            background = X_train[rng.choice(X_train.shape[0], min(args.pd_samples, X_train.shape[0]), replace=False)]
+            print(f"Computing partial dependence over {background.shape[0]} background rows...")
+            save_partial_dependence(compute_partial_dependence(get_model(), background, feature_names))
+
+        rebuilt |= run_stage(
+            manifest,
+            "partial_dependence",
+            downstream(["explain"], pd_samples=args.pd_samples),
+            ["partial_dependence.json"],
+            build_partial_dependence,
+            use_cache,
+        )[1]
+
+    if args.lattice:
+        def build_prediction_lattice():
+            lattice = build_lattice(get_model(), feature_names, step=args.lattice_step, dtype=args.lattice_dtype)
+            save_lattice(lattice, measure_lattice_error(lattice, get_model()))
+
+        rebuilt |= run_stage(
+            manifest,
+            "lattice",
+            downstream(["lattice"], step=args.lattice_step, dtype=args.lattice_dtype),
+            ["prediction_lattice.npz"],
+            build_prediction_lattice,
+            use_cache,
+        )[1]
+
+    if args.surrogate:
+        def build_surrogate():
+            print("Distilling forest into GAM surrogate...")
+            surrogate = fit_gam_surrogate(get_model(), X_train, feature_names, pairwise=not args.no_surrogate_pairs)
+            save_surrogate(surrogate, measure_surrogate_fidelity(surrogate, get_model(), X_test, y_test))
+
+        rebuilt |= run_stage(
+            manifest,
+            "surrogate",
+            downstream(["surrogate"], pairwise=not args.no_surrogate_pairs),
+            ["gam_surrogate.npz"],
+            build_surrogate,
+            use_cache,
+        )[1]
+
+    if args.quantize:
+        def build_quantized_forest():
+            print("Quantizing forest thresholds...")
+            save_quantized_forest(
+                QuantizedForest.from_sklearn(get_fitted_model(), value_dtype=args.quantize_values), feature_names
+            )
+
+        rebuilt |= run_stage(
+            manifest,
+            "quantized_forest",
+            downstream(["forest"], value_dtype=args.quantize_values),
+            ["quantized_forest.npz"],
+            build_quantized_forest,
+            use_cache,
+        )[1]
+    elif (get_models_dir() / QUANTIZED_FOREST_FILENAME).exists():
+        # Serving prefers a quantized forest over the pickle, so one left over from
+        # an earlier --quantize run would keep serving that run's trees
+        (get_models_dir() / QUANTIZED_FOREST_FILENAME).unlink()
+        manifest["stages"].pop("quantized_forest", None)
+        print(f"Removed stale {QUANTIZED_FOREST_FILENAME} (train with --quantize to rebuild it)")
+        rebuilt = True
+
+    if args.shap_interactions:
+        def build_shap_interactions():
+            sample_size = min(args.interaction_samples, len(df))
+            X_sample = df[feature_names].sample(n=sample_size, random_state=42).values
+            summary = compute_shap_interactions(
+                get_fitted_model(),
+                X_sample,
+                feature_names,
+                n_jobs=args.n_jobs,
+            )
+            save_shap_interactions(summary)
+
+        rebuilt |= run_stage(
+            manifest,
+            "shap_interactions",
+            downstream(["train"], samples=args.interaction_samples),
+            ["shap_interactions.json"],
+            build_shap_interactions,
+            use_cache,
+        )[1]
+
+    if rebuilt:
+        # Last, so servers watching models/ only swap in the complete set of artifacts.
+        # The version lists the model's artifacts and those of every stage built from
+        # this model (also by earlier runs); stale ones of other models are left out.
+        served = {
+            name: artifact["sha256"]
+            for stage, record in manifest["stages"].items()
+            if stage == "model" or record["inputs"].get("model_key") == model_key
+            for name, artifact in record["artifacts"].items()
+        }
+        manifest["model_version"] = publish_model_version("forest", served)
+        save_manifest(manifest)
+    else:
+        print("All artifacts are up to date; nothing to publish.")
+
+    print("Done.")
 
 if __name__ == "__main__":
     main()
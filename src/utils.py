@@ -1,5 +1,10 @@
+import os
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
+import numpy as np
+
 # Risk thresholds for the mental health score (balanced quintile-based system)
 # Critical Risk: score < 0
 # High Risk: 0 <= score < 2
@@ -14,6 +19,28 @@ LOW_RISK_THRESHOLD_LOW = 4
 LOW_RISK_THRESHOLD_HIGH = 6
 HEALTHY_THRESHOLD = 6
 
+# Upper edges of the Critical / High / Medium / Low tiers, in order (see categorize_risk)
+RISK_THRESHOLDS = [
+    CRITICAL_RISK_THRESHOLD,
+    HIGH_RISK_THRESHOLD,
+    MEDIUM_RISK_THRESHOLD_HIGH,
+    LOW_RISK_THRESHOLD_HIGH,
+]
+
+# Risk categories in score order; tier i covers RISK_THRESHOLDS[i-1] <= score < RISK_THRESHOLDS[i]
+RISK_CATEGORIES = ["Critical", "High", "Medium", "Low", "Healthy"]
+
+# Valid input ranges for each feature (same bounds the CLI demo prompts for)
+FEATURE_RANGES = {
+    "screen_time_hours": (0.0, 24.0),
+    "social_media_platforms_used": (0, 10),
+    "hours_on_TikTok": (0.0, 12.0),
+    "sleep_hours": (0.0, 12.0),
+}
+
+# Features that only take whole-number values
+INTEGER_FEATURES = {"social_media_platforms_used"}
+
 # Backward compatibility: old threshold names (for figure generation scripts)
 # These represent the old 3-tier system boundaries
 OLD_HIGH_RISK_THRESHOLD = -2  # Old high risk threshold
@@ -48,6 +75,38 @@ def get_models_dir() -> Path:
     return models_dir
 
 
+@contextmanager
+def atomic_path(path: Path):
+    """
+    Yield a temporary path next to `path` to write to. Once the block finishes it
+    replaces `path` in a single os.replace, so readers see either the old file or
+    the complete new one, never a partial write.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.stem}.tmp{path.suffix}")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def bin_index(values, edges: np.ndarray):
+    """Map values to bins defined by `edges` (values outside are clipped to the end bins)."""
+    return np.clip(np.searchsorted(edges[1:-1], values, side="right"), 0, edges.size - 2)
+
+
+def timestamp(label: str):
+    print(f"[DEBUG] {label} at {time.strftime('%H:%M:%S')}")
+
+
+# Targets of the optional multi-output model (`python -m src.train --multi-output`) and
+# their weights in mental_health_score, which is linear in them (see compute_mental_health_score)
+SCORE_COMPONENTS = ["mood_score", "stress_level"]
+SCORE_COMPONENT_WEIGHTS = [1.0, -1.0]
+
+
 def compute_mental_health_score(mood_score: float, stress_level: float) -> float:
     """
     Compute the composite mental health score.
@@ -0,0 +1,77 @@
+"""
+XGBoost model in its native format, for serving.
+
+`python -m src.train_xgb` saves the booster as UBJSON (or JSON) rather than a
+pickle: the file does not depend on the Python class layout, loads straight
+into XGBoost's C++ predictor and can be read by any XGBoost binding. The
+feature order is stored in the booster's attributes.
+"""
+
+import json
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import xgboost as xgb
+from xgboost import XGBRegressor
+
+from .utils import atomic_path, get_models_dir
+
+XGB_MODEL_STEM = "mental_health_xgb"
+# Only one format is kept at a time (see save_xgb_model)
+XGB_MODEL_FORMATS = ("ubj", "json")
+
+
+def save_xgb_model(model: Union[XGBRegressor, xgb.Booster], feature_names: List[str], fmt: str = "ubj") -> Path:
+    """
+    Save the model (an XGBRegressor or a trained Booster) to
+    models/mental_health_xgb.<fmt> in XGBoost's native format and return its
+    path. The model saved in the other format, if any, is deleted so it is never
+    loaded instead.
+    """
+    if fmt not in XGB_MODEL_FORMATS:
+        raise ValueError(f"Unknown XGBoost model format {fmt!r}; expected one of {XGB_MODEL_FORMATS}")
+    model_path = get_models_dir() / f"{XGB_MODEL_STEM}.{fmt}"
+    booster = model.get_booster() if isinstance(model, XGBRegressor) else model
+    booster.set_attr(feature_names=json.dumps(list(feature_names)))
+    with atomic_path(model_path) as tmp_path:
+        booster.save_model(tmp_path)
+    for other in XGB_MODEL_FORMATS:
+        other_path = get_models_dir() / f"{XGB_MODEL_STEM}.{other}"
+        if other != fmt and other_path.exists():
+            other_path.unlink()
+            print(f"Removed {other_path} (replaced by the .{fmt} model)")
+    print(f"Saved XGBoost model to {model_path}")
+    return model_path
+
+
+def xgb_model_filenames() -> List[str]:
+    return [f"{XGB_MODEL_STEM}.{fmt}" for fmt in XGB_MODEL_FORMATS]
+
+
+def load_xgb_model(n_jobs: int = -1, source=None) -> Optional[Tuple[XGBRegressor, List[str]]]:
+    """
+    Load the native XGBoost model (or the one in the open file `source`) as
+    (model, feature_names), or return None if `python -m src.train_xgb` has not
+    been run.
+    """
+    if source is None:
+        model_path = next((get_models_dir() / name for name in xgb_model_filenames()
+                           if (get_models_dir() / name).exists()), None)
+        if model_path is None:
+            return None
+    model = XGBRegressor(n_jobs=n_jobs)
+    # Either format loads from the raw bytes
+    model.load_model(model_path if source is None else bytearray(source.read()))
+    feature_names = json.loads(model.get_booster().attr("feature_names"))
+    return model, feature_names
+
+
+def xgb_contributions(model: XGBRegressor, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact TreeSHAP contributions from XGBoost's built-in pred_contribs, as
+    (contributions (n_rows, n_features), base_value (n_rows,)); for every row
+    base_value + contributions.sum() is the model's prediction.
+    """
+    output = model.get_booster().predict(xgb.DMatrix(np.atleast_2d(X)), pred_contribs=True)
+    return output[:, :-1].astype(np.float64), output[:, -1].astype(np.float64)